@@ -1,7 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import json
 import logging
 import settings
+import time
 import uuid
 
 from bottle import route, run, template, Bottle, request, static_file
@@ -10,11 +12,23 @@ import sqlalchemy.orm
 from sqlalchemy.sql import func
 
 from classes.FormGenerator import FormGenerator
-from helpers.geo_helpers import reverse_geocode
-from helpers.json_serializer import JSONAPIPlugin
+from classes.FormSchema import FormSchema
+from helpers.geo_helpers import reverse_geocode, reverse_geocode_flights, bbox_around
+from helpers.json_serializer import JSONAPIPlugin, conditional_response, request_fields
+from helpers.simplify import tolerance_for_zoom
 from helpers.utils import APIError, with_db_session, generate_apikey, StripPathMiddleware
 from classes.OsmApiClient import OsmApiClient
 from classes.OverpassApi import OverpassApi
+from classes.BuildingStore import BuildingStore
+from classes.RateLimiter import RateLimiter
+from classes.ReplicationWorker import ReplicationWorker
+from classes.LocalGeocoder import LocalGeocoder
+from classes.ReverseGeocoder import ReverseGeocoder
+from classes.TilePrefetcher import TilePrefetcher
+from classes.TTLCache import TTLCache
+from classes.WarmupScheduler import WarmupScheduler
+from classes.WayCache import WayCache
+from classes.UpstreamClient import upstream, UpstreamError, RateLimitedError
 from classes.Database import Base as database, OAuthCache, User, Points
 
 # Logging stuff
@@ -31,7 +45,7 @@ logger.info("run %s on version %s" % (settings.APP_NAME, settings.GIT_VERSION))
 # application routes
 app = Bottle()
 app.catchall = False
-app.install(JSONAPIPlugin())
+app.install(JSONAPIPlugin(compress_min_size=settings.RESPONSE_COMPRESSION["min_size"], compress_level=settings.RESPONSE_COMPRESSION["level"]))
 
 
 sqlalchemy_engine = sqlalchemy.create_engine(settings.DB_CONNECTION, echo=settings.DEBUG)
@@ -39,7 +53,66 @@ database.metadata.create_all(sqlalchemy_engine)
 PgSession = sqlalchemy.orm.sessionmaker(bind=sqlalchemy_engine)
 
 
-overpass = OverpassApi()
+upstream.configure(settings.UPSTREAMS, pool_size=settings.UPSTREAM_POOL_SIZE)
+
+tile_cache = None
+if settings.OVERPASS_TILE_CACHE["enabled"]:
+    tile_cache = TTLCache(max_size=settings.OVERPASS_TILE_CACHE["max_tiles"], ttl=settings.OVERPASS_TILE_CACHE["ttl"])
+
+building_store = None
+if settings.BUILDING_STORE["enabled"]:
+    building_store = BuildingStore(PgSession, zoom=settings.BUILDING_STORE["zoom"], max_age=settings.BUILDING_STORE["max_age"])
+
+geocoder = ReverseGeocoder(reverse_geocode, cell_size=settings.REVERSE_GEOCODE_CACHE["cell_size"],
+                           max_cells=settings.REVERSE_GEOCODE_CACHE["max_cells"], ttl=settings.REVERSE_GEOCODE_CACHE["ttl"],
+                           session_factory=PgSession if settings.REVERSE_GEOCODE_CACHE["persist"] else None,
+                           persist_ttl=settings.REVERSE_GEOCODE_CACHE["persist_ttl"])
+geocode = geocoder.reverse
+
+local_geocoder = None
+if settings.REVERSE_GEOCODER["engine"] == "local":
+    # the local index is exact and fast, only the nominatim fallback is cached
+    local_geocoder = LocalGeocoder(fallback=geocoder.reverse, max_road_distance=settings.REVERSE_GEOCODER["max_road_distance"],
+                                   address_points=settings.REVERSE_GEOCODER["address_points"])
+    # nominatim answers until the extract is loaded
+    local_geocoder.load_async(settings.REVERSE_GEOCODER["extract"])
+    geocode = local_geocoder.reverse
+
+# compiled once, the edit forms are rendered from it without touching settings.EDIT_FIELDS
+form_schema = FormSchema(settings.EDIT_FIELDS)
+
+form_cache = None
+if settings.FORM_CACHE["enabled"]:
+    form_cache = TTLCache(max_size=settings.FORM_CACHE["max_forms"], ttl=settings.FORM_CACHE["ttl"])
+
+# reverse geocoding of the edit form, overlapped with the way lookup and bounded by a deadline
+form_executor = ThreadPoolExecutor(max_workers=settings.EDIT_FORM["workers"], thread_name_prefix="edit-form")
+
+way_cache = None
+if settings.WAY_CACHE["enabled"]:
+    way_cache = WayCache(max_size=settings.WAY_CACHE["max_ways"], ttl=settings.WAY_CACHE["ttl"])
+
+overpass = OverpassApi(tile_cache=tile_cache, tile_zoom=settings.OVERPASS_TILE_CACHE["zoom"], store=building_store, way_cache=way_cache,
+                      max_request_tiles=settings.OVERPASS_TILE_CACHE["max_request_tiles"])
+
+prefetcher = None
+if (tile_cache is not None or building_store is not None) and settings.PREFETCH["enabled"]:
+    prefetcher = TilePrefetcher(overpass, rings=settings.PREFETCH["rings"], workers=settings.PREFETCH["workers"],
+                                max_pending=settings.PREFETCH["max_pending"],
+                                rate_limiter=RateLimiter(settings.PREFETCH["requests_per_minute"] / 60.0, settings.PREFETCH["burst"]),
+                                tiles_per_request=settings.PREFETCH["tiles_per_request"])
+
+warmup = None
+if (tile_cache is not None or building_store is not None) and settings.WARMUP["enabled"]:
+    warmup = WarmupScheduler(overpass, PgSession, settings.WARMUP["regions"], interval=settings.WARMUP["interval"],
+                             rate_limiter=RateLimiter(settings.WARMUP["requests_per_minute"] / 60.0),
+                             tiles_per_request=settings.WARMUP["tiles_per_request"])
+    warmup.start()
+
+if building_store is not None and settings.REPLICATION["enabled"]:
+    replication = ReplicationWorker(building_store, PgSession, directory=settings.REPLICATION["directory"],
+                                    interval=settings.REPLICATION["interval"], start_sequence=settings.REPLICATION["start_sequence"])
+    replication.start()
 
 
 @app.route('/')
@@ -48,6 +121,58 @@ def show_version():
     return {"status": "OK", "results": {"version": settings.GIT_VERSION, "debug": settings.DEBUG}}
 
 
+@app.route('/stats')
+def show_stats():
+    """GET cache and upstream request counters"""
+    return {"status": "OK", "results": {"overpass": overpass.stats(),
+                                         "reverse_geocode": dict(geocoder.stats(), nominatim_single_flight=reverse_geocode_flights.stats()),
+                                         "local_geocoder": local_geocoder.stats() if local_geocoder is not None else None,
+                                         "upstreams": upstream.stats(), "upstream_rate_limits": upstream.rate_limit_stats(),
+                                         "prefetch": prefetcher.stats() if prefetcher is not None else None,
+                                         "warmup": warmup.stats() if warmup is not None else None,
+                                         "forms": form_cache.stats() if form_cache is not None else None}}
+
+
+def simplify_tolerance():
+    """GET the simplification tolerance in meters from the params `tolerance` or `zoom` (`None` for full outlines)"""
+    fields = request_fields()
+    if fields is not None and "nodes" not in fields:
+        # outlines aren´t requested
+        return None
+
+    tolerance = request.query.getunicode("tolerance")
+    zoom = request.query.getunicode("zoom")
+    try:
+        if tolerance:
+            # rounded, the simplified outlines are cached per tolerance
+            tolerance = round(float(tolerance), 1)
+            return tolerance if tolerance > 0 else None
+        if zoom:
+            return tolerance_for_zoom(min(max(int(zoom), 0), 22))
+    except ValueError:
+        raise APIError("tolerance and zoom must be numbers")
+    return None
+
+
+def buildings_by_ids(ids: list) -> dict:
+    """GET many buildings with one overpass query, unknown ids are reported in `missing`"""
+    try:
+        ids = [int(id) for id in ids]
+    except (TypeError, ValueError):
+        raise APIError("ids must be osm way ids")
+
+    if not ids:
+        raise APIError("Need param ids")
+
+    if len(ids) > 999:
+        raise APIError("max 999 ids")
+
+    results, missing = overpass.get_by_osm_ids(ids)
+    if len(results) < 1:
+        return {"status": "ZERO_RESULTS", "results": [], "missing": missing}
+    return {"status": "OK", "results": results, "missing": missing}
+
+
 @app.route('/buildings')
 def get_buildings():
     """GET building in specific bbox
@@ -59,9 +184,18 @@ def get_buildings():
         - `lat` - latitude - user position (if not center of bunding box)
         - `lon` - longitude - user position (if not center of bunding box)
         - `limit` - max of shapes in this bbox
+        - `ids` - comma separated osm ids, GET these buildings instead of a bbox (in this order)
+        - `zoom` - map zoom level, simplifies the outlines to one pixel (optional)
+        - `tolerance` - simplifies the outlines, max deviation in meters (optional - instead of zoom)
+        - `fields` - comma separated attributes of the results, e.g. `id,centroid,distance` (optional - default all)
+        - `stream` - `1` writes the results one by one as chunked output (optional)
 
     """
 
+    ids = request.query.getunicode("ids")
+    if ids:
+        return buildings_by_ids(id for id in ids.split(",") if id.strip())
+
     bbox = {"north": request.query.getunicode("north"), "south": request.query.getunicode(
         "south"), "east": request.query.getunicode("east"), "west": request.query.getunicode("west")}
 
@@ -95,8 +229,36 @@ def get_buildings():
     if limit > 999:
         limit = 999
 
-    results = overpass.get_buildings_without_housenumber_bbox(bbox, user_location=user_location)
-    return {"status": "OK", "results": results[:limit]}
+    # 304 for unchanged tiles, without querying
+    conditional_response(overpass.data_version(bbox))
+
+    results = overpass.get_buildings_without_housenumber_bbox(bbox, user_location=user_location, limit=limit, tolerance=simplify_tolerance())
+    if prefetcher is not None:
+        prefetcher.prefetch_bbox(bbox)
+    return {"status": "OK", "results": results}
+
+
+@app.route('/buildings', ['POST'])
+def post_buildings():
+    """GET many buildings by id
+        :Parameters:
+        - `ids` - a `list` of osm ids as payload (`{"ids": [1, 2, 3]}`)
+    """
+
+    data = request.body.read().decode("utf-8")
+
+    if not data:
+        raise APIError("No data received")
+
+    try:
+        request_body = json.loads(data)
+    except ValueError:
+        raise APIError("Cant parse JSON")
+
+    if type(request_body) is not dict or type(request_body.get("ids")) is not list:
+        raise APIError("Invalid request")
+
+    return buildings_by_ids(request_body["ids"])
 
 
 @app.route('/buildings/nearby')
@@ -108,6 +270,10 @@ def get_buildings_nearby():
         - `radius` - the searchradius in meters
         - `limit` - max of shapes
         - `offset` - offset to skip
+        - `zoom` - map zoom level, simplifies the outlines to one pixel (optional)
+        - `tolerance` - simplifies the outlines, max deviation in meters (optional - instead of zoom)
+        - `fields` - comma separated attributes of the results, e.g. `id,centroid,distance` (optional - default all)
+        - `stream` - `1` writes the results one by one as chunked output (optional)
 
     """
 
@@ -148,8 +314,13 @@ def get_buildings_nearby():
     if limit > 999:
         limit = 999
 
-    results = overpass.get_buildings_without_housenumber_nearby(latitude, longitude, radius)
-    results = results[offset:limit + offset]
+    # 304 for unchanged tiles, without querying
+    conditional_response(overpass.data_version(bbox_around(latitude, longitude, radius)))
+
+    results = overpass.get_buildings_without_housenumber_nearby(latitude, longitude, radius, limit=limit, offset=offset,
+                                                               tolerance=simplify_tolerance())
+    if prefetcher is not None:
+        prefetcher.prefetch_around(latitude, longitude, radius)
     if len(results) < 1:
         return {"status": "ZERO_RESULTS", "results": []}
     else:
@@ -161,9 +332,10 @@ def get_building(id: int):
     """GET a building by id
         :Parameters:
         - `id` - the osm id of the building
+        - `fields` - comma separated attributes, e.g. `id,tags` (optional - default all)
     """
 
-    way = overpass.get_by_osm_id(id)
+    way = overpass.get_way_by_osm_id(id)
     return {"status": "OK", "result": way}
 
 
@@ -173,13 +345,50 @@ def get_building_form(id: int):
         :Parameters:
         - `id` - the osm id of the building
     """
+    # the centroid of a cached or stored way is enough to start geocoding while the current way is loaded
     try:
-        way = overpass.get_by_osm_id(id)
+        known = overpass.get_known_way(id)
+    except ValueError:
+        raise APIError("Building not found", status=404)
+    geocoding = deadline = None
+    if known is not None and known.centroid is not None and FormGenerator.needs_address(form_schema, known.tags):
+        geocoding = form_executor.submit(geocode, *known.centroid)
+        deadline = time.monotonic() + settings.EDIT_FORM["deadline"]
+
+    try:
+        way = overpass.get_way_by_osm_id(id)
     except Exception as e:
         raise APIError("Building not found", status=404)
-    form = FormGenerator(settings.EDIT_FIELDS, way)
 
-    return {"status": "OK", "result": form.generate()}
+    # a new version of the way gets a new form
+    key = (way.id, way.version)
+    if form_cache is not None and way.version is not None:
+        result = form_cache.get(key)
+        if result is not None:
+            return {"status": "OK", "result": result}
+
+    if geocoding is not None and (way.centroid is None or geocoder.cell(*known.centroid) != geocoder.cell(*way.centroid)):
+        # the outline moved the centroid into another cell, the early address may be for another place
+        geocoding = None
+
+    def prefill(lat: float, lon: float) -> dict:
+        """The address within the deadline, a late result still fills the geocoding cache for the next request"""
+        future, until = geocoding, deadline
+        if future is None:
+            future = form_executor.submit(geocode, lat, lon)
+            until = time.monotonic() + settings.EDIT_FORM["deadline"]
+        try:
+            return future.result(timeout=max(until - time.monotonic(), 0))
+        except FutureTimeoutError:
+            raise UpstreamError("reverse geocoding missed the deadline")
+
+    form = FormGenerator(form_schema, way.to_dict(fields=("tags", "centroid")), geocode=prefill)
+    result = form.generate()
+    # forms without the prefilled address aren´t cached
+    if form_cache is not None and way.version is not None and form.complete:
+        form_cache.set(key, result)
+
+    return {"status": "OK", "result": result}
 
 
 @app.route('/buildings/<id>', ['PUT'])
@@ -212,7 +421,7 @@ def update_building(id: int):
     except Exception as e:
         raise APIError("Authentication failed", status=401)
 
-    api = OsmApiClient(oauth_session)
+    api = OsmApiClient(oauth_session, way_cache=way_cache, on_way_updated=overpass.way_updated)
 
     try:
         way = overpass.get_by_osm_id(id)
@@ -237,7 +446,6 @@ def update_building(id: int):
         return {"status": "OK", "result": {"changeset_id": 12345}}
 
 
-    result = api.update_way(id, request_body)
     try:
         result = api.update_way(id, request_body)
     except Exception:
@@ -270,7 +478,63 @@ def reverse_geocode_api():
         return APIError(body="need param lon")
     latitude = float(latitude)
     longitude = float(longitude)
-    return {"status": "OK", "result": reverse_geocode(latitude, longitude)}
+    try:
+        address = geocode(latitude, longitude)
+    except RateLimitedError:
+        raise APIError("Too many geocoding requests", status=503, headers={"Retry-After": "1"})
+    except UpstreamError:
+        raise APIError("Geocoding failed", status=503)
+    return {"status": "OK", "result": address}
+
+
+@app.route('/reverse-geocode', ['POST'])
+def reverse_geocode_batch_api():
+    """Reverse Geocode many shapes, e.g. all buildings of a result page. Points in the same cell of the geocoding cache
+    are geocoded once, points which couldn´t be geocoded (rate limit, deadline) get the address `None`
+        :Parameters:
+            - `points` - a `list` of lat/lon dicts as payload (`{"points": [{"lat": 52.5, "lon": 13.4}]}`)
+    """
+    data = request.body.read().decode("utf-8")
+
+    if not data:
+        raise APIError("No data received")
+
+    try:
+        request_body = json.loads(data)
+    except ValueError:
+        raise APIError("Cant parse JSON")
+
+    if type(request_body) is not dict or type(request_body.get("points")) is not list:
+        raise APIError("Invalid request")
+
+    try:
+        points = [(float(point["lat"]), float(point["lon"])) for point in request_body["points"]]
+    except (KeyError, TypeError, ValueError):
+        raise APIError("points must be lat/lon dicts")
+
+    if len(points) > settings.REVERSE_GEOCODER["max_batch"]:
+        raise APIError("max %s points" % settings.REVERSE_GEOCODER["max_batch"])
+
+    deadline = time.monotonic() + settings.REVERSE_GEOCODER["batch_deadline"]
+    addresses = {}
+    for lat, lon in points:
+        cell = geocoder.cell(lat, lon)
+        if cell in addresses:
+            continue
+        # no call is started which couldn´t get a nominatim slot before the deadline, the lookup is counted once
+        # in the geocoder stats either as cache hit or as miss
+        if time.monotonic() + upstream.expected_wait("nominatim") < deadline:
+            try:
+                address = geocode(lat, lon)
+            except UpstreamError:
+                # the rest of the batch is still answered from the caches
+                address = None
+        else:
+            address = geocoder.cached(lat, lon)
+        addresses[cell] = address
+
+    results = [{"lat": lat, "lon": lon, "address": addresses[geocoder.cell(lat, lon)]} for lat, lon in points]
+    return {"status": "OK", "results": results, "missing": sum(1 for result in results if result["address"] is None)}
 
 
 
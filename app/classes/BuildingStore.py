@@ -0,0 +1,276 @@
+import datetime
+import json
+import sys
+import os
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.Database import Building, BuildingNode, BuildingTile
+from classes.Way import Way, WayBatch
+from helpers.geo_helpers import lat_lon_to_tile, tile_to_bbox
+
+
+class BuildingStore(object):
+
+    def __init__(self, session_factory, zoom: int=16, max_age: int=None):
+        """Persistent local store of buildings without housenumber
+            :Properties:
+                - `session_factory` - a sqlalchemy `sessionmaker`
+                - `zoom` - zoom level of the quadtile grid used as spatial index on the centroids
+                - `max_age` - seconds until a loaded tile is outdated (optional - `None` keeps loaded tiles forever)
+        """
+        self.__session_factory = session_factory
+        self.zoom = zoom
+        self.max_age = max_age
+
+    def loaded_tiles(self, tiles: list, zoom: int) -> set:
+        """Checks which quadtiles are loaded (and not outdated)
+            :Parameters:
+                - `tiles` - a `list` of (x, y) tuples
+                - `zoom` - zoom level of the tiles
+
+            :Returns:
+                a `set` of the loaded tiles
+        """
+        if not tiles:
+            return set()
+
+        session = self.__session_factory()
+        query = session.query(BuildingTile).filter(
+            BuildingTile.zoom == zoom,
+            BuildingTile.x.between(min(x for x, y in tiles), max(x for x, y in tiles)),
+            BuildingTile.y.between(min(y for x, y in tiles), max(y for x, y in tiles)))
+
+        if self.max_age is not None:
+            query = query.filter(BuildingTile.loaded_at >= datetime.datetime.utcnow() - datetime.timedelta(seconds=self.max_age))
+
+        wanted = set(tiles)
+        try:
+            return set((tile.x, tile.y) for tile in query.all()) & wanted
+        finally:
+            session.close()
+
+    def get_ways(self, bbox: dict) -> list:
+        """GET all ways whose bounding box intersects the bbox
+            :Parameters:
+                - `bbox` - the searcharea
+
+            :Returns:
+                a `list` of `Way`
+        """
+        # the centroid of a building intersecting the bbox is at most one tile outside
+        min_x, min_y = lat_lon_to_tile(bbox["north"], bbox["west"], self.zoom)
+        max_x, max_y = lat_lon_to_tile(bbox["south"], bbox["east"], self.zoom)
+
+        session = self.__session_factory()
+        try:
+            rows = session.query(Building).filter(
+                Building.tile_x.between(min_x - 1, max_x + 1), Building.tile_y.between(min_y - 1, max_y + 1),
+                Building.max_lat >= bbox["south"], Building.min_lat <= bbox["north"],
+                Building.max_lon >= bbox["west"], Building.min_lon <= bbox["east"]).all()
+            batch = WayBatch()
+            return [self.__to_way(row, batch) for row in rows]
+        finally:
+            session.close()
+
+    def save_tiles(self, tiles: dict, zoom: int):
+        """Stores fetched quadtiles, buildings of the tiles which aren´t in the new result are removed
+            :Parameters:
+                - `tiles` - a `dict` (x, y) -> `list` of `Way`
+                - `zoom` - zoom level of the tiles
+        """
+        ways = {}
+        for tile_ways in tiles.values():
+            for way in tile_ways:
+                ways[way.id] = way
+
+        if zoom >= self.zoom:
+            cells = set(self.__tile_grid_bbox(x, y, zoom)[:2] for x, y in tiles)
+
+            def covered(cell_x, cell_y):
+                return (cell_x, cell_y) in cells
+        else:
+            shift = self.zoom - zoom
+
+            def covered(cell_x, cell_y):
+                return (cell_x >> shift, cell_y >> shift) in tiles
+
+        bounds = [self.__tile_grid_bbox(x, y, zoom) for x, y in tiles]
+        now = datetime.datetime.utcnow()
+        session = self.__session_factory()
+        try:
+            stale = []
+            if bounds:
+                # one range query over all tiles, the cells of other tiles in the range are filtered out
+                rows = session.query(Building.id, Building.tile_x, Building.tile_y).filter(
+                    Building.tile_x.between(min(b[0] for b in bounds), max(b[2] for b in bounds)),
+                    Building.tile_y.between(min(b[1] for b in bounds), max(b[3] for b in bounds))).all()
+                stale = [way_id for way_id, cell_x, cell_y in rows if way_id not in ways and covered(cell_x, cell_y)]
+
+            self.__delete_ways(session, stale)
+            self.__insert_ways(session, list(ways.values()))
+
+            for x, y in tiles:
+                session.merge(BuildingTile(zoom=zoom, x=x, y=y, loaded_at=now))
+
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def __tile_grid_bbox(self, x: int, y: int, zoom: int) -> tuple:
+        """Maps a quadtile to the range of grid cells of the store
+            :Returns:
+                a `tuple` (min_x, min_y, max_x, max_y)
+        """
+        if zoom >= self.zoom:
+            shift = zoom - self.zoom
+            return x >> shift, y >> shift, x >> shift, y >> shift
+        shift = self.zoom - zoom
+        return x << shift, y << shift, ((x + 1) << shift) - 1, ((y + 1) << shift) - 1
+
+    def save_ways(self, ways: list):
+        """Bulk inserts (or replaces) ways
+            :Parameters:
+                - `ways` - a `list` of `Way`
+        """
+        if not ways:
+            return
+
+        session = self.__session_factory()
+        try:
+            self.__insert_ways(session, ways)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def delete_ways(self, way_ids: list):
+        """Removes ways from the store
+            :Parameters:
+                - `way_ids` - a `list` of way ids
+        """
+        session = self.__session_factory()
+        try:
+            self.__delete_ways(session, way_ids)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_ways_by_id(self, way_ids: list) -> dict:
+        """GET stored ways
+            :Parameters:
+                - `way_ids` - a `list` of way ids
+
+            :Returns:
+                a `dict` way id -> `Way`, unknown ways are missing
+        """
+        way_ids = list(way_ids)
+        session = self.__session_factory()
+        try:
+            result = {}
+            batch = WayBatch()
+            for i in range(0, len(way_ids), self.__chunk_size):
+                for row in session.query(Building).filter(Building.id.in_(way_ids[i:i + self.__chunk_size])):
+                    result[row.id] = self.__to_way(row, batch)
+            return result
+        finally:
+            session.close()
+
+    def get_ways_by_nodes(self, node_ids: list) -> dict:
+        """GET the stored ways using one of the nodes
+            :Parameters:
+                - `node_ids` - a `list` of node ids
+
+            :Returns:
+                a `dict` way id -> `Way`
+        """
+        node_ids = list(node_ids)
+        session = self.__session_factory()
+        try:
+            way_ids = set()
+            for i in range(0, len(node_ids), self.__chunk_size):
+                rows = session.query(BuildingNode.way_id).filter(BuildingNode.node_id.in_(node_ids[i:i + self.__chunk_size]))
+                way_ids.update(way_id for (way_id,) in rows)
+        finally:
+            session.close()
+        return self.get_ways_by_id(way_ids)
+
+    def __insert_ways(self, session, ways: list):
+        """Replaces ways and their node index entries"""
+        self.__delete_ways(session, [way.id for way in ways])
+        session.bulk_insert_mappings(Building, [self.__row_values(way) for way in ways])
+        session.bulk_insert_mappings(BuildingNode, [{"node_id": node_id, "way_id": way.id} for way in ways for node_id in set(way.node_ids)])
+
+    def __delete_ways(self, session, way_ids: list):
+        for i in range(0, len(way_ids), self.__chunk_size):
+            chunk = way_ids[i:i + self.__chunk_size]
+            session.query(Building).filter(Building.id.in_(chunk)).delete(synchronize_session=False)
+            session.query(BuildingNode).filter(BuildingNode.way_id.in_(chunk)).delete(synchronize_session=False)
+
+    def mark_loaded(self, bbox: dict, zoom: int) -> int:
+        """Marks all quadtiles completely inside the bbox as loaded
+            :Parameters:
+                - `bbox` - e.g. the bounds of an imported extract
+                - `zoom` - zoom level of the tiles
+
+            :Returns:
+                the number of marked tiles
+        """
+        min_x, min_y = lat_lon_to_tile(bbox["north"], bbox["west"], zoom)
+        max_x, max_y = lat_lon_to_tile(bbox["south"], bbox["east"], zoom)
+        # skip the partially covered border tiles
+        if tile_to_bbox(min_x, min_y, zoom)["west"] < bbox["west"]:
+            min_x += 1
+        if tile_to_bbox(min_x, min_y, zoom)["north"] > bbox["north"]:
+            min_y += 1
+        if tile_to_bbox(max_x, max_y, zoom)["east"] > bbox["east"]:
+            max_x -= 1
+        if tile_to_bbox(max_x, max_y, zoom)["south"] < bbox["south"]:
+            max_y -= 1
+        if min_x > max_x or min_y > max_y:
+            return 0
+
+        now = datetime.datetime.utcnow()
+        session = self.__session_factory()
+        try:
+            session.query(BuildingTile).filter(
+                BuildingTile.zoom == zoom, BuildingTile.x.between(min_x, max_x), BuildingTile.y.between(min_y, max_y)).delete(synchronize_session=False)
+            for x in range(min_x, max_x + 1):
+                session.bulk_insert_mappings(BuildingTile, [{"zoom": zoom, "x": x, "y": y, "loaded_at": now} for y in range(min_y, max_y + 1)])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        return (max_x - min_x + 1) * (max_y - min_y + 1)
+
+    # max number of ids per IN query
+    __chunk_size = 400
+
+    def __row_values(self, way: Way) -> dict:
+        """Converts a way to the column values of a `Building` row"""
+        lats = way.lats
+        lons = way.lons
+        tile_x, tile_y = lat_lon_to_tile(way.centroid[0], way.centroid[1], self.zoom)
+
+        return {"id": way.id, "tags": json.dumps(way.tags),
+                "nodes": json.dumps([[node_id, lat, lon] for node_id, lat, lon in zip(way.node_ids, lats, lons)]),
+                "centroid_lat": way.centroid[0], "centroid_lon": way.centroid[1],
+                "min_lat": min(lats), "max_lat": max(lats), "min_lon": min(lons), "max_lon": max(lons),
+                "tile_x": tile_x, "tile_y": tile_y, "updated_at": datetime.datetime.utcnow()}
+
+    def __to_way(self, row: Building, batch: WayBatch) -> Way:
+        """Converts a `Building` row to a way in the batch"""
+        nodes = json.loads(row.nodes)
+        return batch.add(row.id, json.loads(row.tags), [node[0] for node in nodes], [node[1] for node in nodes], [node[2] for node in nodes],
+                         (row.centroid_lat, row.centroid_lon))
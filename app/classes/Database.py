@@ -4,7 +4,7 @@ import os
 import sys
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.orm import backref, relationship
 
 sys.path.append(
@@ -55,3 +55,73 @@ class OAuthCache(Base):
     request_token = Column(String)
     request_token_secret = Column(String)
     uuid = Column(String)
+
+
+
+class Building(Base):
+    """Local store of buildings without housenumber, spatially indexed by the quadtile of the centroid"""
+    __tablename__ = "buildings"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    tags = Column(Text)
+    # json list of [node id, lat, lon]
+    nodes = Column(Text)
+    centroid_lat = Column(Float)
+    centroid_lon = Column(Float)
+    min_lat = Column(Float)
+    max_lat = Column(Float)
+    min_lon = Column(Float)
+    max_lon = Column(Float)
+    tile_x = Column(Integer)
+    tile_y = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (Index("ix_buildings_tile", "tile_x", "tile_y"),)
+
+
+class BuildingTile(Base):
+    """Quadtiles which are completely loaded into the building store"""
+    __tablename__ = "building_tiles"
+
+    zoom = Column(Integer, primary_key=True, autoincrement=False)
+    x = Column(Integer, primary_key=True, autoincrement=False)
+    y = Column(Integer, primary_key=True, autoincrement=False)
+    loaded_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class BuildingNode(Base):
+    """Node -> way index of the building store, to find the ways of moved nodes"""
+    __tablename__ = "building_nodes"
+
+    node_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    way_id = Column(BigInteger, primary_key=True, autoincrement=False, index=True)
+
+
+class ReplicationState(Base):
+    """Last applied osmChange sequence number per replication stream"""
+    __tablename__ = "replication_state"
+
+    name = Column(String, primary_key=True)
+    sequence = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class WarmupState(Base):
+    """Progress of the cache warm-up per region, to resume after a restart"""
+    __tablename__ = "warmup_state"
+
+    name = Column(String, primary_key=True)
+    # index of the next tile batch and the number of batches of the region
+    position = Column(Integer, default=0)
+    batches = Column(Integer)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+
+class ReverseGeocodeCell(Base):
+    """Persisted reverse geocoding results per spatial cell"""
+    __tablename__ = "reverse_geocode_cells"
+
+    cell = Column(String, primary_key=True)
+    address = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
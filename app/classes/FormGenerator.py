@@ -1,27 +1,42 @@
+import logging
 import sys
 import os
 sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.FormSchema import FormSchema
+from classes.UpstreamClient import UpstreamError
 from helpers.geo_helpers import reverse_geocode
 
+logger = logging.getLogger(__name__)
+
 
 class FormGenerator(object):
 
-    def __init__(self, form_fields: list, way: dict):
+    def __init__(self, form_fields, way: dict, geocode=reverse_geocode):
         """Generates a JSON representation of the edit form for the clients
                 :Properties:
-                        - `form_fields` - a `list` with all available form fields and there properties
+                        - `form_fields` - the compiled `FormSchema` (or a `list` with all available form fields and there properties)
                         - `way` - a `dict` with the data from the overpass api
+                        - `geocode` - reverse geocoding function (lat, lon) -> address, e.g. `ReverseGeocoder.reverse`
         """
-        self.__form_fields = form_fields
+        self.__schema = form_fields if isinstance(form_fields, FormSchema) else FormSchema(form_fields)
         self.__tags = way["tags"]
+        self.complete = True
         location = way["centroid"]
-        self.__location = {"location": location, "address": reverse_geocode(location["lat"], location["lon"])}
-        print(self.__location)
-
-    __form_fields = []
-    __tags = {}
-    __location = {}
+        address = {}
+        if self.needs_address(self.__schema, self.__tags):
+            try:
+                address = geocode(location["lat"], location["lon"])
+            except UpstreamError as e:
+                # the form works without prefilled address fields
+                logger.warning("reverse geocoding for the edit form failed: %s" % e)
+                self.complete = False
+        self.__location = {"location": location, "address": address}
+
+    @staticmethod
+    def needs_address(schema: FormSchema, tags: dict) -> bool:
+        """True if a prefilled field isn´t tagged yet, so the form needs the reverse geocoded address"""
+        return any(field.prefilled and field.name not in tags for field in schema)
 
     OSM_TO_NOMINATIM_MAPPING = {
         "addr:street": ["road"],
@@ -33,32 +48,23 @@ class FormGenerator(object):
     def generate(self):
         """Generates the Form
                 :Returns:
-                        a `list` of form field dicts
+                        a new `list` of form field dicts
         """
 
         output = []
 
-        for key, form_field in enumerate(self.__form_fields):
+        for form_field in self.__schema:
 
             # set value
-            if form_field["name"] in self.__tags:
-                form_field["value"] = self.__tags[form_field["name"]]
-                form_field["prefilled"] = False
-            elif form_field["prefilled"] is True:
-                form_field["value"] = self.__get_nominatim_value(form_field["name"])
-                if form_field["value"] is None:
-                    form_field["prefilled"] = False
+            if form_field.name in self.__tags:
+                output.append(form_field.render(self.__tags[form_field.name]))
+            elif form_field.prefilled:
+                value = self.__get_nominatim_value(form_field.name)
+                output.append(form_field.render(value, value is not None))
             else:
-                form_field["value"] = None
-                form_field["prefilled"] = False
-
-            if form_field["type"] is "select" and form_field["value"] is not None:
-                if not self.__search_options(form_field["options"], form_field["value"]):
-                    form_field["options"].append({"value": form_field["value"], "label": form_field["value"]})
+                output.append(form_field.render())
 
-            self.__form_fields[key] = form_field
-
-        return self.__form_fields
+        return output
 
     def __get_nominatim_value(self, key):
         """GET an attribute from nominatim reverse geocoding
@@ -74,18 +80,3 @@ class FormGenerator(object):
                     return self.__location["address"][nominatim_key]
 
         return None
-
-    def __search_options(self, options, value):
-        """Helper method for search for option in the option list
-                :Parameters:
-                        - `options` - list of options
-                        - `value` - the current value
-
-                :Returns:
-                        true if the option is in the list else false
-        """
-        for option in options:
-            if value == option["value"]:
-                return True
-
-        return False
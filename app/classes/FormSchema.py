@@ -0,0 +1,48 @@
+class FormField(object):
+    """A compiled form field, immutable and shared between all requests"""
+    __slots__ = ("name", "type", "prefilled", "attributes", "options", "option_values")
+
+    def __init__(self, field: dict):
+        self.name = field["name"]
+        self.type = field["type"]
+        self.prefilled = field.get("prefilled") is True
+        # the static attributes, copied into every rendered field
+        self.attributes = tuple((key, value) for key, value in field.items() if key not in ("options", "value", "prefilled"))
+        self.options = tuple(dict(option) for option in field.get("options", ())) if self.type == "select" else None
+        self.option_values = frozenset(option["value"] for option in self.options) if self.options is not None else None
+
+    def render(self, value=None, prefilled: bool=False) -> dict:
+        """GET the field with a value in the api format (a new `dict`, the options are shared - don´t mutate them)"""
+        result = dict(self.attributes)
+        result["prefilled"] = prefilled
+        result["value"] = value
+        if self.options is not None:
+            if value is not None and value not in self.option_values:
+                # e.g. a building type the schema doesn´t know yet
+                result["options"] = self.options + ({"value": value, "label": value},)
+            else:
+                result["options"] = self.options
+        return result
+
+
+class FormSchema(object):
+
+    def __init__(self, form_fields: list):
+        """The edit form fields, compiled once (e.g. from `settings.EDIT_FIELDS`), the given `list` isn´t changed
+            :Properties:
+                - `form_fields` - a `list` of form field dicts (`type`, `name`, `label`, `prefilled`, `options` for selects, ...)
+        """
+        self.fields = tuple(FormField(field) for field in form_fields)
+        self.__by_name = dict((field.name, field) for field in self.fields)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, name: str) -> FormField:
+        return self.__by_name[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__by_name
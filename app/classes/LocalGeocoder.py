@@ -0,0 +1,402 @@
+import bz2
+import gzip
+import logging
+import threading
+import time
+import sys
+import os
+import xml.etree.ElementTree as etree
+from math import cos, radians, sqrt, floor
+
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.NodeIndex import NodeIndex
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111195.0
+
+
+class _Grid(object):
+    """Uniform grid of items with a bounding box, for nearest neighbour lookups"""
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.count = 0
+
+    def add(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, item):
+        for x in range(self.__cell(min_lat), self.__cell(max_lat) + 1):
+            for y in range(self.__cell(min_lon), self.__cell(max_lon) + 1):
+                self.cells.setdefault((x, y), []).append(item)
+        self.count += 1
+
+    def near(self, lat: float, lon: float, radius: float) -> list:
+        """GET the items of all cells within `radius` meters (items spanning cells may be returned more than once)"""
+        delta_lat = radius / METERS_PER_DEGREE
+        delta_lon = radius / (METERS_PER_DEGREE * max(cos(radians(lat)), 0.000001))
+        result = []
+        for x in range(self.__cell(lat - delta_lat), self.__cell(lat + delta_lat) + 1):
+            for y in range(self.__cell(lon - delta_lon), self.__cell(lon + delta_lon) + 1):
+                result.extend(self.cells.get((x, y), ()))
+        return result
+
+    def __cell(self, value: float) -> int:
+        return int(floor(value / self.cell_size))
+
+
+class _Index(object):
+    """The loaded data, replaced as a whole when an extract is (re)loaded"""
+
+    def __init__(self):
+        # (lat1, lon1, lat2, lon2, name) street segments
+        self.roads = _Grid(0.005)
+        # (lat, lon, place, name) place nodes
+        self.places = _Grid(0.05)
+        # (lat, lon, postcode) addresses with postcode, only with `address_points`
+        self.postcodes = _Grid(0.005)
+        # `_PostcodeArea`
+        self.postcode_areas = _Grid(0.05)
+
+
+class _PostcodeArea(object):
+    """Postcode boundary, the edges (of all rings) are bucketed into latitude bands for point in polygon tests"""
+    __slots__ = ("postcode", "bands")
+
+    band_size = 0.01
+
+    def __init__(self, postcode: str):
+        self.postcode = postcode
+        self.bands = {}
+
+    def add_edge(self, lat1: float, lon1: float, lat2: float, lon2: float):
+        edge = (lat1, lon1, lat2, lon2)
+        for band in range(int(floor(min(lat1, lat2) / self.band_size)), int(floor(max(lat1, lat2) / self.band_size)) + 1):
+            self.bands.setdefault(band, []).append(edge)
+
+    def contains(self, lat: float, lon: float) -> bool:
+        """Even-odd ray casting over all edges, works for unordered member ways and inner rings"""
+        inside = False
+        for lat1, lon1, lat2, lon2 in self.bands.get(int(floor(lat / self.band_size)), ()):
+            if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                inside = not inside
+        return inside
+
+
+class LocalGeocoder(object):
+
+    # search radius of the place types in meters
+    PLACE_RADIUS = {"city": 15000, "town": 6000, "village": 2500, "suburb": 1500, "hamlet": 1000}
+
+    def __init__(self, fallback=None, max_road_distance: int=250, max_postcode_distance: int=300, address_points: bool=False,
+                 batch_size: int=500, node_index_path: str=None):
+        """Offline reverse geocoding from the streets, places and postcodes of an OSM extract,
+        answers the nominatim address keys (road, suburb, hamlet, village, town, city, postcode)
+            :Properties:
+                - `fallback` - reverse geocoding function (lat, lon) -> address, used outside of the extract or before it is loaded (optional)
+                - `max_road_distance` - max distance to the nearest street in meters
+                - `max_postcode_distance` - max distance to the nearest address with postcode in meters (without postcode boundary)
+                - `address_points` - index the nodes and buildings with `addr:postcode` as postcode fallback outside of postcode
+                  boundaries, there are millions of them in a country extract (default: only `boundary=postal_code`)
+                - `batch_size` - ways per node index lookup while loading .osm extracts
+                - `node_index_path` - file for the on-disk node coordinate index while loading (optional - a temporary file is used)
+        """
+        self.__fallback = fallback
+        self.max_road_distance = max_road_distance
+        self.max_postcode_distance = max_postcode_distance
+        self.address_points = address_points
+        self.__batch_size = batch_size
+        self.__node_index_path = node_index_path
+        self.__index = None
+        self.__lock = threading.Lock()
+        self.lookups = 0
+        self.fallbacks = 0
+
+    def reverse(self, lat: float, lon: float) -> dict:
+        """Reverse geocodes a location, with the fallback if the location isn´t covered
+            :Returns:
+                an address `dict` like nominatim
+        """
+        address = self.lookup(lat, lon)
+        if self.__fallback is not None and not address:
+            with self.__lock:
+                self.fallbacks += 1
+            return self.__fallback(lat, lon)
+        return address
+
+    def lookup(self, lat: float, lon: float) -> dict:
+        """Reverse geocodes a location with the local index only
+            :Returns:
+                an address `dict`, empty if the location isn´t covered
+        """
+        lat = float(lat)
+        lon = float(lon)
+        index = self.__index
+        with self.__lock:
+            self.lookups += 1
+        if index is None:
+            return {}
+
+        scale = cos(radians(lat))
+        address = {}
+
+        road = self.__nearest(index.roads.near(lat, lon, self.max_road_distance),
+                              lambda segment: _segment_distance(lat, lon, segment, scale), self.max_road_distance)
+        if road is not None:
+            address["road"] = road[4]
+
+        places = {}
+        for place in index.places.near(lat, lon, max(self.PLACE_RADIUS.values())):
+            distance = _distance(lat, lon, place[0], place[1], scale)
+            if distance <= self.PLACE_RADIUS[place[2]] and (place[2] not in places or distance < places[place[2]][0]):
+                places[place[2]] = (distance, place[3])
+        for place, (distance, name) in places.items():
+            address[place] = name
+
+        for area in index.postcode_areas.near(lat, lon, 0):
+            if area.contains(lat, lon):
+                address["postcode"] = area.postcode
+                break
+        else:
+            postcode = self.__nearest(index.postcodes.near(lat, lon, self.max_postcode_distance),
+                                      lambda point: _distance(lat, lon, point[0], point[1], scale), self.max_postcode_distance)
+            if postcode is not None:
+                address["postcode"] = postcode[2]
+
+        return address
+
+    def load(self, path: str) -> dict:
+        """Loads an extract (.osm, .osm.bz2, .osm.gz, .osm.pbf), replaces the loaded data when complete
+            :Returns:
+                a `dict` with the number of loaded roads, places, postcodes and the seconds
+        """
+        started_at = time.time()
+        index = _Index()
+        if path.endswith(".pbf"):
+            self.__load_pbf(path, index)
+        else:
+            self.__load_xml(path, index)
+        self.__index = index
+
+        result = {"roads": index.roads.count, "places": index.places.count, "postcodes": index.postcodes.count,
+                  "postcode_areas": index.postcode_areas.count, "seconds": time.time() - started_at}
+        logger.info("local geocoder loaded %(roads)s road segments, %(places)s places, %(postcodes)s postcodes, %(postcode_areas)s postcode areas in %(seconds).1fs" % result)
+        return result
+
+    def load_async(self, path: str):
+        """Loads an extract in a background thread, until then the fallback is used"""
+        thread = threading.Thread(target=self.__load_logged, args=(path,), name="local-geocoder")
+        thread.daemon = True
+        thread.start()
+
+    def __load_logged(self, path: str):
+        try:
+            self.load(path)
+        except Exception:
+            logger.exception("loading the local geocoder from %s failed" % path)
+
+    def __nearest(self, items: list, distance, max_distance: float):
+        result = None
+        for item in items:
+            item_distance = distance(item)
+            if item_distance <= max_distance:
+                result = item
+                max_distance = item_distance
+        return result
+
+    def __load_xml(self, path: str, index: _Index):
+        """Two streaming passes, the second one only for the member ways of postcode boundary relations,
+        the node references of the ways are resolved in batches
+        """
+        nodes = NodeIndex(self.__node_index_path)
+        try:
+            areas = {}
+            members = {}
+            pending = []
+            with self.__open(path) as handle:
+                for element in self.__iter_xml(handle):
+                    tags = dict((tag.get("k"), tag.get("v")) for tag in element.iter("tag"))
+                    if element.tag == "node":
+                        lat = float(element.get("lat"))
+                        lon = float(element.get("lon"))
+                        nodes.add(int(element.get("id")), lat, lon)
+                        self.__add_node(index, lat, lon, tags)
+                    elif element.tag == "way":
+                        if self.__wanted_way(tags):
+                            pending.append((tags, [int(nd.get("ref")) for nd in element.iter("nd")]))
+                            if len(pending) >= self.__batch_size:
+                                self.__resolve(pending, nodes, lambda tags, coordinates: self.__add_way(index, coordinates, tags))
+                                pending = []
+                    elif element.tag == "relation":
+                        if self.__is_postcode_boundary(tags):
+                            area = _PostcodeArea(self.__postcode(tags))
+                            for member in element.iter("member"):
+                                if member.get("type") == "way":
+                                    members.setdefault(int(member.get("ref")), []).append(area)
+                            areas[element.get("id")] = area
+            self.__resolve(pending, nodes, lambda tags, coordinates: self.__add_way(index, coordinates, tags))
+
+            if members:
+                pending = []
+                with self.__open(path) as handle:
+                    for element in self.__iter_xml(handle, ("way",)):
+                        way_areas = members.get(int(element.get("id")))
+                        if way_areas is not None:
+                            pending.append((way_areas, [int(nd.get("ref")) for nd in element.iter("nd")]))
+                            if len(pending) >= self.__batch_size:
+                                self.__resolve(pending, nodes, self.__add_area_edges)
+                                pending = []
+                self.__resolve(pending, nodes, self.__add_area_edges)
+
+            self.__add_areas(index, areas.values())
+        finally:
+            nodes.close()
+
+    def __resolve(self, pending: list, nodes: NodeIndex, add):
+        """Resolves the node references of a batch of ways with one node index lookup
+            :Parameters:
+                - `pending` - a `list` of (value, node ids)
+                - `nodes` - the node index
+                - `add` - called with (value, coordinates) per way, nodes outside of the extract are left out
+        """
+        if not pending:
+            return
+        coordinates = nodes.get_many(ref for _, refs in pending for ref in refs)
+        for value, refs in pending:
+            add(value, [coordinates[ref] for ref in refs if ref in coordinates])
+
+    def __load_pbf(self, path: str, index: _Index):
+        if osmium is None:
+            raise RuntimeError("pyosmium is required to load .pbf extracts")
+
+        add_node = self.__add_node
+        add_way = self.__add_way
+        add_area_edges = self.__add_area_edges
+        wanted_way = self.__wanted_way
+        is_postcode_boundary = self.__is_postcode_boundary
+        postcode = self.__postcode
+        areas = []
+        members = {}
+
+        class PlaceHandler(osmium.SimpleHandler):
+
+            def node(self, node):
+                if node.tags:
+                    add_node(index, node.location.lat, node.location.lon, dict((tag.k, tag.v) for tag in node.tags))
+
+            def way(self, way):
+                tags = dict((tag.k, tag.v) for tag in way.tags)
+                if wanted_way(tags):
+                    add_way(index, [(node.location.lat, node.location.lon) for node in way.nodes if node.location.valid()], tags)
+
+            def relation(self, relation):
+                tags = dict((tag.k, tag.v) for tag in relation.tags)
+                if is_postcode_boundary(tags):
+                    area = _PostcodeArea(postcode(tags))
+                    for member in relation.members:
+                        if member.type == "w":
+                            members.setdefault(member.ref, []).append(area)
+                    areas.append(area)
+
+        class MemberHandler(osmium.SimpleHandler):
+
+            def way(self, way):
+                way_areas = members.get(way.id)
+                if way_areas is not None:
+                    add_area_edges(way_areas, [(node.location.lat, node.location.lon) for node in way.nodes if node.location.valid()])
+
+        PlaceHandler().apply_file(path, locations=True)
+        if members:
+            MemberHandler().apply_file(path, locations=True)
+        self.__add_areas(index, areas)
+
+    def __add_node(self, index: _Index, lat: float, lon: float, tags: dict):
+        if tags.get("place") in self.PLACE_RADIUS and tags.get("name"):
+            index.places.add(lat, lon, lat, lon, (lat, lon, tags["place"], tags["name"]))
+        if self.address_points and tags.get("addr:postcode"):
+            index.postcodes.add(lat, lon, lat, lon, (lat, lon, tags["addr:postcode"]))
+
+    def __wanted_way(self, tags: dict) -> bool:
+        return bool(tags.get("highway") and tags.get("name")) or bool(self.address_points and tags.get("addr:postcode")) or \
+            self.__is_postcode_boundary(tags)
+
+    def __add_way(self, index: _Index, coordinates: list, tags: dict):
+        if not coordinates:
+            return
+
+        if tags.get("highway") and tags.get("name"):
+            for (lat1, lon1), (lat2, lon2) in zip(coordinates, coordinates[1:]):
+                index.roads.add(min(lat1, lat2), min(lon1, lon2), max(lat1, lat2), max(lon1, lon2), (lat1, lon1, lat2, lon2, tags["name"]))
+
+        if self.address_points and tags.get("addr:postcode"):
+            # buildings with address, the first node is close enough
+            lat, lon = coordinates[0]
+            index.postcodes.add(lat, lon, lat, lon, (lat, lon, tags["addr:postcode"]))
+
+        if self.__is_postcode_boundary(tags) and coordinates[0] == coordinates[-1]:
+            area = _PostcodeArea(self.__postcode(tags))
+            self.__add_area_edges([area], coordinates)
+            self.__add_areas(index, [area])
+
+    def __add_area_edges(self, areas: list, coordinates: list):
+        for (lat1, lon1), (lat2, lon2) in zip(coordinates, coordinates[1:]):
+            for area in areas:
+                area.add_edge(lat1, lon1, lat2, lon2)
+
+    def __add_areas(self, index: _Index, areas):
+        for area in areas:
+            edges = [edge for band in area.bands.values() for edge in band]
+            if not edges:
+                continue
+            index.postcode_areas.add(min(min(edge[0], edge[2]) for edge in edges), min(min(edge[1], edge[3]) for edge in edges),
+                                     max(max(edge[0], edge[2]) for edge in edges), max(max(edge[1], edge[3]) for edge in edges), area)
+
+    def __is_postcode_boundary(self, tags: dict) -> bool:
+        return tags.get("boundary") == "postal_code" and bool(self.__postcode(tags))
+
+    def __postcode(self, tags: dict) -> str:
+        return tags.get("postal_code") or tags.get("addr:postcode")
+
+    def __iter_xml(self, handle, wanted: tuple=("node", "way", "relation")):
+        """Streams the complete elements of an OSM XML file, memory is released after every element"""
+        context = etree.iterparse(handle, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event != "end" or element.tag not in ("node", "way", "relation"):
+                continue
+            if element.tag in wanted:
+                yield element
+            root.clear()
+
+    def __open(self, path: str):
+        if path.endswith(".bz2"):
+            return bz2.open(path, "rb")
+        if path.endswith(".gz"):
+            return gzip.open(path, "rb")
+        return open(path, "rb")
+
+    def stats(self) -> dict:
+        index = self.__index
+        return {"loaded": index is not None, "lookups": self.lookups, "fallbacks": self.fallbacks,
+                "roads": index.roads.count if index is not None else 0, "places": index.places.count if index is not None else 0}
+
+
+def _distance(lat1: float, lon1: float, lat2: float, lon2: float, scale: float) -> float:
+    """Equirectangular distance in meters, `scale` is the cosine of the latitude"""
+    return sqrt(((lat2 - lat1) * METERS_PER_DEGREE) ** 2 + ((lon2 - lon1) * METERS_PER_DEGREE * scale) ** 2)
+
+
+def _segment_distance(lat: float, lon: float, segment: tuple, scale: float) -> float:
+    """Distance of a point to a (lat1, lon1, lat2, lon2, ...) segment in meters"""
+    x1 = (segment[1] - lon) * scale
+    y1 = segment[0] - lat
+    dx = (segment[3] - segment[1]) * scale
+    dy = segment[2] - segment[0]
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0.0 else max(0.0, min(1.0, -(x1 * dx + y1 * dy) / length))
+    return sqrt((x1 + t * dx) ** 2 + (y1 + t * dy) ** 2) * METERS_PER_DEGREE
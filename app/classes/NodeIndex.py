@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import tempfile
+
+
+class NodeIndex(object):
+
+    def __init__(self, path: str=None, batch_size: int=50000):
+        """On-disk node id -> coordinate index, keeps memory bounded for large extracts
+            :Properties:
+                - `path` - the sqlite file (optional - a temporary file is used and removed on `close`)
+                - `batch_size` - nodes buffered before they are written
+        """
+        self.__temporary = path is None
+        if self.__temporary:
+            handle, path = tempfile.mkstemp(suffix=".nodes.sqlite")
+            os.close(handle)
+        self.path = path
+        self.__batch_size = batch_size
+        self.__buffer = []
+
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=OFF")
+        self.__db.execute("PRAGMA synchronous=OFF")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, lat REAL, lon REAL)")
+
+    # max number of sql variables per query
+    __chunk_size = 900
+
+    def add(self, node_id: int, lat: float, lon: float):
+        """Adds or moves a node"""
+        self.__buffer.append((node_id, lat, lon))
+        if len(self.__buffer) >= self.__batch_size:
+            self.flush()
+
+    def remove(self, node_id: int):
+        self.flush()
+        self.__db.execute("DELETE FROM nodes WHERE id = ?", (node_id,))
+
+    def flush(self):
+        if self.__buffer:
+            self.__db.executemany("INSERT OR REPLACE INTO nodes (id, lat, lon) VALUES (?, ?, ?)", self.__buffer)
+            self.__db.commit()
+            self.__buffer = []
+
+    def get_many(self, node_ids) -> dict:
+        """GET the coordinates of nodes
+            :Parameters:
+                - `node_ids` - an iterable of node ids
+
+            :Returns:
+                a `dict` node id -> (lat, lon), unknown nodes are missing
+        """
+        self.flush()
+        node_ids = list(set(node_ids))
+        result = {}
+        for i in range(0, len(node_ids), self.__chunk_size):
+            chunk = node_ids[i:i + self.__chunk_size]
+            rows = self.__db.execute("SELECT id, lat, lon FROM nodes WHERE id IN (%s)" % ",".join("?" * len(chunk)), chunk)
+            for node_id, lat, lon in rows:
+                result[node_id] = (lat, lon)
+        return result
+
+    def close(self):
+        self.__db.close()
+        if self.__temporary and os.path.exists(self.path):
+            os.remove(self.path)
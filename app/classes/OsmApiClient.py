@@ -1,3 +1,4 @@
+import logging
 import sys
 import os
 
@@ -6,13 +7,24 @@ import xml.dom.minidom
 
 sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.UpstreamClient import upstream, UpstreamError
 from helpers.utils import APIError
 
+logger = logging.getLogger(__name__)
+
 
 class OsmApiClient(object):
 
-    def __init__(self, session):
+    def __init__(self, session, way_cache=None, on_way_updated=None):
+        """OpenStreetMap API connector
+            :Properties:
+                - `session` - the oauth session of the user
+                - `way_cache` - a `WayCache`, patched with the tags of newer versions read from the api (optional)
+                - `on_way_updated` - called with (way id, tags, version) after a successful edit, e.g. to keep caches coherent (optional)
+        """
         self.__connection = session
+        self.__way_cache = way_cache
+        self.__on_way_updated = on_way_updated
 
     __connection = None
 
@@ -28,8 +40,19 @@ class OsmApiClient(object):
         :Return:
             dict with waydata
         """
+        response = upstream.get("osm_api", "/api/0.6/way/%s" % str(id))
+        if response.status_code != 200:
+            raise UpstreamError("osm_api responded with status %s" % response.status_code)
+
+        data = xml.dom.minidom.parseString(response.content)
+        data = data.getElementsByTagName("osm")[0].getElementsByTagName("way")[0]
         osmapi = OsmApi(api=self.__api_endpoint)
-        return osmapi.WayGet(id)
+        way = osmapi._DomParseWay(data)
+
+        # the authoritative version, cached overpass results may lag behind
+        if self.__way_cache is not None:
+            self.__way_cache.update_tags(way["id"], way["version"], way["tag"])
+        return way
 
     def update_way(self, id: int, data: dict):
         """Simple method to update ways
@@ -45,39 +68,67 @@ class OsmApiClient(object):
         osmapi = OsmApi(api=self.__api_endpoint)
 
         changeset_create_request = osmapi._XmlBuild("changeset", {"tag": {"comment": str(self.__default_comment)}})
-        changeset = self.__connection.put("changeset/create", headers={"Content-Type": "application/xml"}, data=changeset_create_request.decode("utf-8"))
+        changeset = upstream.put("osm_api", "changeset/create", session=self.__connection, headers={"Content-Type": "application/xml"}, data=changeset_create_request.decode("utf-8"))
         try:
             changeset = int(changeset.text)
         except ValueError:
             raise APIError("Authentication failed!", status=401)
-        way = self.get_way(id)
-        osmapi._CurrentChangesetId = changeset
+        try:
+            way = self.get_way(id)
+            osmapi._CurrentChangesetId = changeset
 
-        # TODO(felix): support not only tags
+            # TODO(felix): support not only tags
 
-        tags = data["tags"]
+            tags = data["tags"]
 
-        for tag, value in tags.items():
-            if tag in way["tag"]:
-                if value != way["tag"][tag] and value is not None:
+            for tag, value in tags.items():
+                if tag in way["tag"]:
+                    if value != way["tag"][tag] and value is not None:
+                        way["tag"][tag] = value
+                elif value is not None:
                     way["tag"][tag] = value
-            elif value is not None:
-                way["tag"][tag] = value
-
-        way["changeset"] = changeset
-        way_change_request = osmapi._XmlBuild("way", way).decode("utf-8")
-        self.__connection.put("way/%s" % str(id), headers={"Content-Type": "application/xml"}, data=way_change_request)
-        self.__connection.put("changeset/%s/close" % str(id), data={})
 
+            way["changeset"] = changeset
+            way_change_request = osmapi._XmlBuild("way", way).decode("utf-8")
+            response = upstream.put("osm_api", "way/%s" % str(id), session=self.__connection, headers={"Content-Type": "application/xml"}, data=way_change_request)
+            if response.status_code != 200:
+                raise UpstreamError("osm_api responded with status %s" % response.status_code)
+        except Exception:
+            self.__close_changeset(changeset)
+            raise
+
+        if self.__on_way_updated is not None:
+            # the api responds with the new version
+            try:
+                version = int(response.text)
+            except ValueError:
+                version = None
+            try:
+                self.__on_way_updated(id, way["tag"], version)
+            except Exception:
+                # the edit is saved, stale caches expire with their ttl
+                logger.exception("updating the caches after the edit of way %s failed" % id)
+
+        self.__close_changeset(changeset)
         return changeset
 
+    def __close_changeset(self, changeset: int):
+        """Closes a changeset, errors are only logged (the api closes open changesets after an hour of inactivity)"""
+        try:
+            response = upstream.put("osm_api", "changeset/%s/close" % str(changeset), session=self.__connection, data={})
+        except UpstreamError:
+            logger.exception("closing changeset %s failed" % changeset)
+            return
+        if response.status_code != 200:
+            logger.warning("closing changeset %s failed, osm_api responded with status %s" % (changeset, response.status_code))
+
     def get_user_details(self):
         """Get details about logged in user
             :Returns:
                 A dict with userdata
         
         """
-        response = self.__connection.get("user/details")
+        response = upstream.get("osm_api", "user/details", session=self.__connection)
         data = xml.dom.minidom.parseString(response.text)
         data = data.getElementsByTagName("osm")[0]
         data = data.getElementsByTagName("user")[0]
@@ -0,0 +1,200 @@
+import bz2
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as etree
+
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.NodeIndex import NodeIndex
+from classes.Way import WayBatch
+from helpers.osm_helpers import is_building_without_housenumber
+
+logger = logging.getLogger(__name__)
+
+
+class OsmImporter(object):
+
+    def __init__(self, store, tile_zoom: int=16, batch_size: int=500, node_index_path: str=None):
+        """Streaming import of OSM extracts (.osm, .osm.bz2, .osm.gz, .osm.pbf) into the building store
+            :Properties:
+                - `store` - the `BuildingStore`
+                - `tile_zoom` - zoom level of the quadtiles marked as loaded (the zoom of the overpass tile cache)
+                - `batch_size` - ways per bulk insert
+                - `node_index_path` - file for the on-disk node coordinate index (optional - a temporary file is used)
+        """
+        self.__store = store
+        self.__tile_zoom = tile_zoom
+        self.__batch_size = batch_size
+        self.__node_index_path = node_index_path
+        self.__batch = WayBatch()
+        self.__stats = {}
+        self.__started_at = None
+
+    __log_interval = 10000
+
+    def import_file(self, path: str) -> dict:
+        """Imports an extract, all quadtiles completely inside the bounds of the extract are marked as loaded
+            :Parameters:
+                - `path` - path of the extract
+
+            :Returns:
+                a `dict` with the number of imported and skipped ways, marked tiles and the throughput
+        """
+        self.__batch = WayBatch()
+        self.__stats = {"ways": 0, "skipped": 0}
+        self.__started_at = time.time()
+
+        if path.endswith(".pbf"):
+            bounds = self.__import_pbf(path)
+        else:
+            bounds = self.__import_xml(path)
+        self.__flush()
+
+        tiles = self.__store.mark_loaded(bounds, self.__tile_zoom) if bounds is not None else 0
+
+        seconds = time.time() - self.__started_at
+        result = dict(self.__stats, tiles=tiles, seconds=seconds, ways_per_second=self.__stats["ways"] / seconds if seconds else 0.0)
+        logger.info("imported %(ways)s ways (%(skipped)s skipped, %(tiles)s tiles) in %(seconds).1fs, %(ways_per_second).0f ways/sec" % result)
+        return result
+
+    def __import_xml(self, path: str) -> dict:
+        """Streaming pass over an OSM XML extract, nodes are written to the node index, matching ways are resolved in batches
+            :Returns:
+                the bounds of the extract or `None`
+        """
+        nodes = NodeIndex(self.__node_index_path)
+        pending = []
+        bounds = None
+
+        with self.__open(path) as handle:
+            try:
+                context = etree.iterparse(handle, events=("start", "end"))
+                _, root = next(context)
+                for event, element in context:
+                    if event != "end":
+                        continue
+
+                    if element.tag == "node":
+                        nodes.add(int(element.get("id")), float(element.get("lat")), float(element.get("lon")))
+                    elif element.tag == "way":
+                        tags = dict((tag.get("k"), tag.get("v")) for tag in element.iter("tag"))
+                        if is_building_without_housenumber(tags):
+                            pending.append((int(element.get("id")), tags, [int(nd.get("ref")) for nd in element.iter("nd")]))
+                            if len(pending) >= self.__batch_size:
+                                self.__resolve(pending, nodes)
+                                pending = []
+                    elif element.tag == "bounds":
+                        bounds = {"south": float(element.get("minlat")), "west": float(element.get("minlon")),
+                                  "north": float(element.get("maxlat")), "east": float(element.get("maxlon"))}
+                    elif element.tag != "relation":
+                        # children (tag, nd, member) are needed until their parent is complete
+                        continue
+
+                    # drop the parsed elements to keep memory bounded
+                    root.clear()
+
+                self.__resolve(pending, nodes)
+            finally:
+                nodes.close()
+
+        return bounds
+
+    def __import_pbf(self, path: str) -> dict:
+        """Streaming pass over a PBF extract using pyosmium with an on-disk node location index
+            :Returns:
+                the bounds of the extract or `None`
+        """
+        if osmium is None:
+            raise RuntimeError("pyosmium is required to import .pbf extracts")
+
+        add_way = self.__add_way
+        stats = self.__stats
+
+        class BuildingHandler(osmium.SimpleHandler):
+
+            def way(self, way):
+                tags = dict((tag.k, tag.v) for tag in way.tags)
+                if not is_building_without_housenumber(tags):
+                    return
+                refs = []
+                lats = []
+                lons = []
+                for node in way.nodes:
+                    if not node.location.valid():
+                        stats["skipped"] += 1
+                        return
+                    refs.append(node.ref)
+                    lats.append(node.location.lat)
+                    lons.append(node.location.lon)
+                add_way(way.id, tags, refs, lats, lons)
+
+        index_path = self.__node_index_path
+        if index_path is None:
+            handle, index_path = tempfile.mkstemp(suffix=".nodes.idx")
+            os.close(handle)
+        try:
+            BuildingHandler().apply_file(path, locations=True, idx="sparse_file_array,%s" % index_path)
+        finally:
+            if self.__node_index_path is None:
+                os.remove(index_path)
+
+        reader = osmium.io.Reader(path, osmium.osm.osm_entity_bits.NOTHING)
+        try:
+            box = reader.header().box()
+        finally:
+            reader.close()
+        if not box.valid():
+            return None
+        return {"south": box.bottom_left.lat, "west": box.bottom_left.lon, "north": box.top_right.lat, "east": box.top_right.lon}
+
+    def __resolve(self, pending: list, nodes: NodeIndex):
+        """Resolves the node references of a batch of ways
+            :Parameters:
+                - `pending` - a `list` of (way id, tags, node ids)
+                - `nodes` - the node index
+        """
+        coordinates = nodes.get_many(ref for _, _, refs in pending for ref in refs)
+        for way_id, tags, refs in pending:
+            if not all(ref in coordinates for ref in refs):
+                # incomplete way at the border of the extract
+                self.__stats["skipped"] += 1
+                continue
+            self.__add_way(way_id, tags, refs, [coordinates[ref][0] for ref in refs], [coordinates[ref][1] for ref in refs])
+
+    def __add_way(self, way_id: int, tags: dict, refs: list, lats: list, lons: list):
+        if len(refs) < 3:
+            self.__stats["skipped"] += 1
+            return
+        self.__batch.add(way_id, tags, refs, lats, lons)
+        if len(self.__batch.ways) >= self.__batch_size:
+            self.__flush()
+
+    def __flush(self):
+        if not self.__batch.ways:
+            return
+
+        self.__batch.calculate_centroids()
+        self.__store.save_ways(self.__batch.ways)
+        before = self.__stats["ways"]
+        self.__stats["ways"] += len(self.__batch.ways)
+        self.__batch = WayBatch()
+
+        if before // self.__log_interval != self.__stats["ways"] // self.__log_interval:
+            seconds = time.time() - self.__started_at
+            logger.info("imported %s ways, %.0f ways/sec" % (self.__stats["ways"], self.__stats["ways"] / seconds if seconds else 0.0))
+
+    def __open(self, path: str):
+        if path.endswith(".bz2"):
+            return bz2.open(path, "rb")
+        if path.endswith(".gz"):
+            return gzip.open(path, "rb")
+        return open(path, "rb")
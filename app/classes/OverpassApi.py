@@ -1,30 +1,59 @@
+import hashlib
+import heapq
+import itertools
 import json
+import logging
 import sys
 import os
-
-import requests
+import uuid
+from collections import OrderedDict
+from operator import itemgetter
 
 sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
-from helpers.geo_helpers import calculate_centroid, geo_distance
-
-
-class OverpassApi(object):
+from classes.SingleFlight import SingleFlight
+from classes.UpstreamClient import upstream, UpstreamError
+from classes.Way import Way, WayBatch, WayResult
+from helpers.geo_batch import batch_distances
+from helpers.geo_helpers import calculate_centroid, geo_distance, lat_lon_to_tile, tile_to_bbox, tiles_for_bbox, count_tiles_for_bbox, bbox_around
+from helpers.json_stream import iter_array_items
+from helpers.osm_helpers import BUILDING_TYPES_FILTER, is_building_without_housenumber
 
-    def __init__(self):
-        """OverpassAPI connector, tot retrieve buildings, without housenumber, …"""
-        pass
+logger = logging.getLogger(__name__)
 
-    __overpass_api_url = "http://www.overpass-api.de/api/interpreter"
 
-    __filter_building_types = "garage|transformer_tower|sty|stable|shed|roof|hut|hangar|greenhouse|garages|farm_auxiliary|cowshed|cabin|bunker|bridge|barn|static_caravan|houseboat|terrace|train_station"
+class OverpassApi(object):
 
-    def get_buildings_without_housenumber_bbox(self, bbox: dict, user_location=None) -> list:
+    def __init__(self, tile_cache=None, tile_zoom: int=16, store=None, way_cache=None, max_request_tiles: int=256):
+        """OverpassAPI connector, tot retrieve buildings, without housenumber, …
+            :Properties:
+                - `tile_cache` - a `TTLCache` for the results per quadtile, entries are (version, ways) (optional - without cache every request queries overpass)
+                - `tile_zoom` - zoom level of the cached quadtiles
+                - `store` - a `BuildingStore`, overpass is only queried for tiles not loaded yet (optional)
+                - `way_cache` - a `WayCache` for the lookups by osm id (optional)
+                - `max_request_tiles` - larger searchareas are queried directly, without tile cache and store
+        """
+        self.__tile_cache = tile_cache
+        self.__tile_zoom = tile_zoom
+        self.__store = store
+        self.__way_cache = way_cache
+        self.max_request_tiles = max_request_tiles
+        self.__flights = SingleFlight()
+        # tile versions are unique per process, so data versions of different processes never collide
+        self.__instance = uuid.uuid4().hex
+        self.__tile_versions = itertools.count(1)
+
+    __filter_building_types = BUILDING_TYPES_FILTER
+
+    def get_buildings_without_housenumber_bbox(self, bbox: dict, user_location=None, limit: int=None, offset: int=0, tolerance: float=None) -> list:
         """GET `list` of shapefiles (mostly buildings) without housenumbers in area
             
             :Properties:
                 - `bbox` - the searcharea
                 - `user_location` - the location of the user (optional - if the user location isn´t the centroid of the `bbox`)
+                - `limit` - max number of results (optional)
+                - `offset` - number of (nearest) results to skip
+                - `tolerance` - simplify the outlines, max deviation in meters (optional)
 
 
             :Returns:
@@ -32,40 +61,31 @@ class OverpassApi(object):
 
         """
 
-        query = """
-        <osm-script output="json" timeout="25">
-          <union>
-            <query type="way">
-              <has-kv k="building"/>
-              <has-kv k="addr:housenumber" modv="not" regv="."/>
-              <has-kv k="building" modv="not" regv="%s"/>
-              <bbox-query  s="%s" w="%s" n="%s" e="%s"/>
-            </query>
-          </union>
-          <print mode="body"/>
-          <recurse type="down"/>
-          <print mode="skeleton" order="quadtile"/>
-        </osm-script>
-        """ % (self.__filter_building_types, bbox["south"], bbox["west"], bbox["north"], bbox["east"])
-
         # calculate centroid of boundingbox for result sorting
         location = calculate_centroid([{"lat": bbox["south"], "lon": bbox["west"]}, {"lat": bbox["south"], "lon": bbox["east"]}, {
                                       "lat": bbox["north"], "lon": bbox["east"]}, {"lat": bbox["north"], "lon": bbox["west"]}])
 
-        results = self.__format_api_result(requests.post(self.__overpass_api_url, data={"data": query}).json()["elements"])
+        if not self.is_tiled(bbox):
+            results = self.__query(self.__bbox_query(bbox))
+        else:
+            results = [way for way in self.__get_tiled_ways(bbox) if self.__way_in_bbox(way, bbox)]
+
         #when user_location isnt centroid of bundingbox
         if user_location is not None:
           location = user_location
         results = self.__calculate_distance(results, location)
-        return self.__sort_by_distance(results)
+        return self.__sort_by_distance(results, limit, offset, tolerance)
 
-    def get_buildings_without_housenumber_nearby(self, lat: float, lon: float, radius: int) -> list:
+    def get_buildings_without_housenumber_nearby(self, lat: float, lon: float, radius: int, limit: int=None, offset: int=0, tolerance: float=None) -> list:
         """GET `list` of shapefiles (mostly buildings) without housenumbers arround the point
             
             :Properties:
                 - `lat` - latitude
                 - `lon` - longitude
                 - `radius` - searchradius
+                - `limit` - max number of results (optional)
+                - `offset` - number of (nearest) results to skip
+                - `tolerance` - simplify the outlines, max deviation in meters (optional)
 
 
             :Returns:
@@ -82,84 +102,433 @@ class OverpassApi(object):
               <has-kv k="building" modv="not" regv="%s"/>
               <around lat="%s" lon="%s" radius="%s"/>
             </query>
+            <recurse type="down"/>
           </union>
-          <print mode="body"/>
-          <recurse type="down"/>
-          <print mode="skeleton" order="quadtile"/>
+          <print mode="body" order="quadtile"/>
         </osm-script>
         """ % (self.__filter_building_types, lat, lon, radius)
 
-        results = self.__format_api_result(requests.post(self.__overpass_api_url, data={"data": query}).json()["elements"])
+        if not self.is_tiled(bbox_around(lat, lon, radius)):
+            results = self.__query(query)
+        else:
+            results = [way for way in self.__get_tiled_ways(bbox_around(lat, lon, radius)) if self.__way_in_radius(way, lat, lon, radius)]
 
         results = self.__calculate_distance(results, {"lat": lat, "lon": lon})
 
-        return self.__sort_by_distance(results)
+        return self.__sort_by_distance(results, limit, offset, tolerance)
+
+    def get_by_osm_id(self, osm_id) -> dict:
+        """GET a way by osm id in the api format"""
+        return self.get_way_by_osm_id(osm_id).to_dict()
+
+    def get_way_by_osm_id(self, osm_id):
+        """GET a way by osm id
+            :Returns:
+                a `Way`
+        """
+        if self.__way_cache is not None:
+            way = self.__way_cache.get(osm_id)
+            if way is not None:
+                return way
 
-    def get_by_osm_id(self, osm_id):
+        # only the way is printed with meta data (for the version), the nodes only with their coordinates
         query = """
         <osm-script output="json" timeout="25">
-          <id-query ref="%s" type="way"/>
-          <print/>
-          <print mode="body"/>
-          <recurse type="down"/>
-          <print mode="skeleton" order="quadtile"/>
+          <id-query ref="%s" type="way" into="ways"/>
+          <recurse type="way-node" from="ways" into="nodes"/>
+          <print from="nodes" mode="skeleton"/>
+          <print from="ways" mode="meta"/>
         </osm-script>
         """ % (osm_id)
 
-        return self.__format_api_result(requests.post(self.__overpass_api_url, data={"data": query}).json()["elements"])[0]
+        way = self.__query(query)[0]
+        if self.__way_cache is not None:
+            way = self.__way_cache.set(way)
+        return way
+
+    def get_known_way(self, osm_id):
+        """GET a way from the way cache or the building store, without an overpass query (the stored tags may be outdated)
+            :Returns:
+                a `Way` or `None`
+        """
+        if self.__way_cache is not None:
+            way = self.__way_cache.get(osm_id)
+            if way is not None:
+                return way
+
+        if self.__store is not None:
+            return self.__store.get_ways_by_id([int(osm_id)]).get(int(osm_id))
+        return None
+
+    def get_by_osm_ids(self, osm_ids: list) -> tuple:
+        """GET many ways with one overpass query, ways already in the building store aren´t queried again
+            :Properties:
+                - `osm_ids` - a `list` of way ids
+
+            :Returns:
+                a `tuple` (ways, missing), the `list` of found ways in the requested order and the `list` of ids not found
+        """
+        osm_ids = list(OrderedDict.fromkeys(int(osm_id) for osm_id in osm_ids))
+
+        found = {}
+        if self.__way_cache is not None:
+            for osm_id in osm_ids:
+                way = self.__way_cache.get(osm_id)
+                if way is not None:
+                    found[osm_id] = way
+
+        if self.__store is not None:
+            found.update(self.__store.get_ways_by_id([osm_id for osm_id in osm_ids if osm_id not in found]))
+
+        remaining = [osm_id for osm_id in osm_ids if osm_id not in found]
+        if remaining:
+            for way in self.__query(self.__ids_query(remaining)):
+                found[way.id] = self.__way_cache.set(way) if self.__way_cache is not None else way
+
+        return [found[osm_id] for osm_id in osm_ids if osm_id in found], [osm_id for osm_id in osm_ids if osm_id not in found]
+
+    def way_updated(self, osm_id, tags: dict, version: int=None):
+        """Cache coherence hook for a successful edit, patches the way in the way cache, the tile cache and the building store
+        (or removes it, if it isn´t a building without housenumber anymore)
+            :Properties:
+                - `osm_id` - the osm id of the way
+                - `tags` - the new tags
+                - `version` - the new osm version (optional - without version the way is evicted from the way cache)
+        """
+        osm_id = int(osm_id)
+        building = is_building_without_housenumber(tags)
+
+        # the geometry is needed to find the tiles of the way
+        way = self.__way_cache.get(osm_id) if self.__way_cache is not None else None
+        if way is None and self.__store is not None:
+            way = self.__store.get_ways_by_id([osm_id]).get(osm_id)
+
+        if self.__way_cache is not None:
+            if version is None:
+                self.__way_cache.pop(osm_id)
+            else:
+                self.__way_cache.update_tags(osm_id, version, tags)
+
+        if way is None:
+            return
+        patched = way.with_tags(dict(tags), version)
+
+        if self.__tile_cache is not None:
+            for tile in set(lat_lon_to_tile(lat, lon, self.__tile_zoom) for lat, lon in way.coordinates()):
+                key = (self.__tile_zoom,) + tile
+                entry = self.__tile_cache.get(key)
+                if entry is None:
+                    continue
+                # a new list, the cached one may be in use by a running request
+                tile_ways = [patched if tile_way.id == osm_id else tile_way for tile_way in entry[1] if building or tile_way.id != osm_id]
+                self.__tile_cache.replace(key, (next(self.__tile_versions), tile_ways))
+
+        if self.__store is not None:
+            if building:
+                self.__store.save_ways([patched])
+            else:
+                self.__store.delete_ways([osm_id])
+
+    def __ids_query(self, osm_ids: list) -> str:
+        """Builds the overpass query for a list of way ids (one union, then the nodes of all ways),
+        only the ways are printed with meta data (for the version), the nodes only with their coordinates"""
+        return """
+        <osm-script output="json" timeout="25">
+          <union into="ways">
+            %s
+          </union>
+          <recurse type="way-node" from="ways" into="nodes"/>
+          <print from="nodes" mode="skeleton"/>
+          <print from="ways" mode="meta"/>
+        </osm-script>
+        """ % "\n            ".join('<id-query ref="%s" type="way"/>' % osm_id for osm_id in osm_ids)
+
+    def __bbox_query(self, bbox: dict) -> str:
+        """Builds the overpass query for buildings without housenumber in a bbox"""
+        return """
+        <osm-script output="json" timeout="25">
+          <union>
+            <query type="way">
+              <has-kv k="building"/>
+              <has-kv k="addr:housenumber" modv="not" regv="."/>
+              <has-kv k="building" modv="not" regv="%s"/>
+              <bbox-query  s="%s" w="%s" n="%s" e="%s"/>
+            </query>
+            <recurse type="down"/>
+          </union>
+          <print mode="body" order="quadtile"/>
+        </osm-script>
+        """ % (self.__filter_building_types, bbox["south"], bbox["west"], bbox["north"], bbox["east"])
+
+    def __query(self, query: str) -> list:
+        """Runs a query against the overpass api
+            :Parameters:
+                - `query` - the overpass xml query
+
+            :Returns:
+                the formatted `list` of ways (shared with coalesced callers, don´t mutate it)
+        """
+        # identical queries in flight are sent only once
+        return self.__flights.do(" ".join(query.split()), self.__post_query, query)
+
+    def __post_query(self, query: str) -> list:
+        # queries are read only, so failed ones can be retried
+        response = upstream.post("overpass", data={"data": query}, idempotent=True, stream=True)
+        try:
+            if response.status_code != 200:
+                raise UpstreamError("overpass responded with status %s" % response.status_code)
+
+            rest = {}
+            try:
+                ways = self.__format_api_result(iter_array_items(response.iter_content(chunk_size=65536), "elements", rest))
+            except ValueError as e:
+                raise UpstreamError("overpass responded with invalid JSON: %s" % e)
+            # runtime errors (timeout, out of memory) are reported after a truncated element list
+            if "remark" in rest:
+                raise UpstreamError("overpass: %s" % rest["remark"])
+            return ways
+        finally:
+            response.close()
+
+    @property
+    def tile_zoom(self) -> int:
+        return self.__tile_zoom
+
+    def load_tiles(self, tiles: list, rate_limiter=None, wait: bool=False) -> int:
+        """Loads quadtiles into the tile cache (and the building store), e.g. for prefetching, cached tiles are skipped
+            :Parameters:
+                - `tiles` - a `list` of (x, y) tuples
+                - `rate_limiter` - a `RateLimiter`, one token per overpass query, without token nothing is fetched (optional)
+                - `wait` - wait for the token of the `rate_limiter` instead of skipping the query
+
+            :Returns:
+                the number of tiles fetched from overpass
+        """
+        if self.__tile_cache is None and self.__store is None:
+            return 0
+
+        missing = [tile for tile in tiles if self.__tile_cache is None or (self.__tile_zoom,) + tuple(tile) not in self.__tile_cache]
+        if missing and self.__store is not None:
+            stored = self.__load_tiles(missing)
+            missing = [tile for tile in missing if tile not in stored]
+        if not missing:
+            return 0
+        if rate_limiter is not None and not (rate_limiter.acquire() if wait else rate_limiter.try_acquire()):
+            return 0
+        self.__fetch_tiles(missing)
+        return len(missing)
+
+    def is_tiled(self, bbox: dict) -> bool:
+        """True if a searcharea is served from the quadtiles (tile cache or building store), i.e. it has at most `max_request_tiles` tiles"""
+        if self.__tile_cache is None and self.__store is None:
+            return False
+        return count_tiles_for_bbox(bbox, self.__tile_zoom) <= self.max_request_tiles
+
+    def data_version(self, bbox: dict) -> str:
+        """GET the version of the cached data covering a bbox, it changes with every (re)load or patch of one of its tiles
+            :Parameters:
+                - `bbox` - the searcharea
+
+            :Returns:
+                the version `str` or `None`, if not all tiles are cached
+        """
+        if self.__tile_cache is None or not self.is_tiled(bbox):
+            return None
+
+        versions = []
+        for tile in tiles_for_bbox(bbox, self.__tile_zoom):
+            entry = self.__tile_cache.get((self.__tile_zoom,) + tile)
+            if entry is None:
+                return None
+            versions.append(str(entry[0]))
+        return "%s-%s" % (self.__instance, hashlib.sha1(",".join(versions).encode("ascii")).hexdigest())
+
+    def stats(self) -> dict:
+        """Cache and request coalescing counters
+            :Returns:
+                a `dict` with the stats
+        """
+        return {"tile_cache": self.__tile_cache.stats() if self.__tile_cache is not None else None,
+                "way_cache": self.__way_cache.stats() if self.__way_cache is not None else None,
+                "single_flight": self.__flights.stats()}
+
+    def __get_tiled_ways(self, bbox: dict) -> list:
+        """GET all ways of the quadtiles covering the bbox, tiles are looked up in the tile cache, then in the building store, only the remaining tiles are fetched from overpass
+            :Parameters:
+                - `bbox` - the searcharea
+
+            :Returns:
+                a `list` of ways (unsorted, each way only once)
+        """
+        ways = {}
+        missing = []
+        for tile in tiles_for_bbox(bbox, self.__tile_zoom):
+            entry = self.__tile_cache.get((self.__tile_zoom,) + tile) if self.__tile_cache is not None else None
+            if entry is None:
+                missing.append(tile)
+                continue
+            for way in entry[1]:
+                ways[way.id] = way
+
+        if missing and self.__store is not None:
+            stored = self.__load_tiles(missing)
+            missing = [tile for tile in missing if tile not in stored]
+            for tile_ways in stored.values():
+                for way in tile_ways:
+                    ways[way.id] = way
+
+        if missing:
+            for tile_ways in self.__fetch_tiles(missing).values():
+                for way in tile_ways:
+                    ways[way.id] = way
+
+        return list(ways.values())
+
+    def __load_tiles(self, tiles: list) -> dict:
+        """Loads quadtiles from the building store and stores them in the tile cache
+            :Parameters:
+                - `tiles` - a `list` of (x, y) tuples
+
+            :Returns:
+                a `dict` tile -> `list` of ways, only for tiles loaded in the store
+        """
+        loaded = self.__store.loaded_tiles(tiles, self.__tile_zoom)
+        if not loaded:
+            return {}
 
-    def __format_api_result(self, data: list) -> list:
-        """Reformats the result `list` from the overpass api (aggregates th shape data)
+        result = self.__split_into_tiles(self.__store.get_ways(self.__tiles_bbox(loaded)), loaded)
+        self.__cache_tiles(result)
+        return result
+
+    def __fetch_tiles(self, tiles: list) -> dict:
+        """Fetches quadtiles with one overpass query and stores them in the tile cache and the building store
+            :Parameters:
+                - `tiles` - a `list` of (x, y) tuples
+
+            :Returns:
+                a `dict` tile -> `list` of ways
+        """
+        query = self.__bbox_query(self.__tiles_bbox(tiles))
+        fetched = self.__split_into_tiles(self.__query(query), tiles)
+
+        self.__cache_tiles(fetched)
+        if self.__store is not None:
+            try:
+                self.__store.save_tiles(fetched, self.__tile_zoom)
+            except Exception:
+                # the fetched tiles are served anyway, the store loads them again next time
+                logger.exception("saving %s tiles to the building store failed" % len(fetched))
+
+        return fetched
+
+    def __tiles_bbox(self, tiles) -> dict:
+        """Calculates the bounding box of quadtiles"""
+        bounds = [tile_to_bbox(x, y, self.__tile_zoom) for x, y in tiles]
+        return {"north": max(b["north"] for b in bounds), "south": min(b["south"] for b in bounds),
+                "east": max(b["east"] for b in bounds), "west": min(b["west"] for b in bounds)}
+
+    def __split_into_tiles(self, ways: list, tiles) -> dict:
+        """Assigns ways to quadtiles, a way belongs to every tile one of its nodes is in
+            :Parameters:
+                - `ways` - a `list` of ways
+                - `tiles` - the wanted tiles
+
+            :Returns:
+                a `dict` tile -> `list` of ways (with an entry for every wanted tile)
+        """
+        result = dict((tile, []) for tile in tiles)
+        for way in ways:
+            for tile in set(lat_lon_to_tile(lat, lon, self.__tile_zoom) for lat, lon in way.coordinates()):
+                if tile in result:
+                    result[tile].append(way)
+        return result
+
+    def __cache_tiles(self, tiles: dict):
+        if self.__tile_cache is None:
+            return
+        for tile, tile_ways in tiles.items():
+            self.__tile_cache.set((self.__tile_zoom,) + tile, (next(self.__tile_versions), tile_ways))
+
+    def __way_in_bbox(self, way: Way, bbox: dict) -> bool:
+        """True if one node of the way is in the bbox (same semantic as the overpass bbox-query)"""
+        for lat, lon in way.coordinates():
+            if bbox["south"] <= lat <= bbox["north"] and bbox["west"] <= lon <= bbox["east"]:
+                return True
+        return False
+
+    def __way_in_radius(self, way: Way, lat: float, lon: float, radius: int) -> bool:
+        """True if one node of the way is within radius meters (same semantic as the overpass around query)"""
+        for node_lat, node_lon in way.coordinates():
+            if geo_distance(lat, lon, node_lat, node_lon) * 1000 <= radius:
+                return True
+        return False
+
+    def __format_api_result(self, data) -> list:
+        """Reformats the result from the overpass api (aggregates th shape data)
         :Parameters:
-            - `data` - original overpass api result
+            - `data` - an iterable of the original overpass api elements (nodes printed before the ways)
 
         :Returns:
-            the reformated result
+            the reformated result, a `list` of compact `Way` objects sharing one `WayBatch`
 
         """
-
+        batch = WayBatch()
+        # only the node coordinates are kept
         nodes = {}
-        ways = []
+        pending = []
 
         for item in data:
             if item["type"] == "node":
-                nodes[item["id"]] = item
+                nodes[item["id"]] = (item["lat"], item["lon"])
 
             elif item["type"] == "way":
-                ways.append(item)
+                if all(node in nodes for node in item["nodes"]):
+                    self.__add_way(batch, item, nodes)
+                else:
+                    # ways printed before their nodes
+                    pending.append(item)
 
-        result = []
-        for way in ways:
-            temp_nodes = []
-            for node in way["nodes"]:
-                temp_nodes.append({"lat": nodes[node]["lat"], "lon": nodes[node]["lon"], "id": node})
+        for way in pending:
+            self.__add_way(batch, way, nodes)
 
-            way["nodes"] = temp_nodes
-            way["centroid"] = calculate_centroid(temp_nodes)
-            result.append(way)
+        # all centroids in one pass
+        batch.calculate_centroids()
+        return batch.ways
 
-        return result
+    def __add_way(self, batch: WayBatch, way: dict, nodes: dict):
+        coordinates = [nodes[node] for node in way["nodes"]]
+        batch.add(way["id"], way.get("tags", {}), way["nodes"], [lat for lat, lon in coordinates], [lon for lat, lon in coordinates],
+                  version=way.get("version"))
 
     def __calculate_distance(self, results: list, location: dict) -> list:
-        """Adds the distance to the resultset
+        """Calculates the distance of every result
             :Parameters:
                 - `results` - a resultlist
                 - `location` - the location for distance calculation
 
             :Returns:
-                A `list` of results with a distance parameter
+                A `list` of (distance, way) tuples
         """
-        for key, value in enumerate(results):
-            results[key]["distance"] = geo_distance(location["lat"], location["lon"], value["centroid"]["lat"], value["centroid"]["lon"])
-
-        return results
+        distances = batch_distances(location["lat"], location["lon"], [way.centroid[0] for way in results], [way.centroid[1] for way in results])
+        return list(zip(distances, results))
 
-    def __sort_by_distance(self, results: list) -> list:
-        """Sorts the resultsset by distance
+    def __sort_by_distance(self, results: list, limit: int=None, offset: int=0, tolerance: float=None) -> list:
+        """Sorts the resultsset by distance and cuts out the requested page, only the ways of the page are expanded
             :Parameters:
-                - `results` - A resultlist
+                - `results` - A `list` of (distance, way) tuples
+                - `limit` - max number of results (optional)
+                - `offset` - results to skip
+                - `tolerance` - simplify the outlines of the page (optional)
             :Returns:
-                A sorted `list` of results
+                A sorted `list` of `WayResult`
         """
-
-        return sorted(results, key=lambda k: k['distance'])
+        if limit is None:
+            results = sorted(results, key=itemgetter(0))
+        else:
+            # top-k selection instead of sorting everything
+            results = heapq.nsmallest(offset + limit, results, key=itemgetter(0))
+
+        # converted to dicts when the response is serialized
+        if tolerance:
+            return [WayResult(way.simplify(tolerance), distance) for distance, way in results[offset:]]
+        return [WayResult(way, distance) for distance, way in results[offset:]]
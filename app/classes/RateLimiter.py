@@ -0,0 +1,80 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate: float, burst: int=1, max_queue: int=None):
+        """Threadsafe token bucket, waiting callers are served in order
+            :Properties:
+                - `rate` - tokens per second
+                - `burst` - max tokens saved up while idle
+                - `max_queue` - max callers waiting for tokens, more are rejected (optional - default unbounded)
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.max_queue = max_queue
+        self.__tokens = float(burst)
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+        self.__waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+
+    def try_acquire(self, tokens: float=1) -> bool:
+        """Takes tokens if available, without waiting"""
+        return self.__reserve(tokens, 0.0) == 0.0
+
+    def acquire(self, tokens: float=1, timeout: float=None) -> bool:
+        """Waits until tokens are available. The tokens are reserved up front, so a caller which would have to wait
+        longer than `timeout` is rejected at once instead of waiting in vain
+            :Parameters:
+                - `tokens` - the number of tokens
+                - `timeout` - max seconds to wait (optional)
+
+            :Returns:
+                `False` if the tokens wouldn´t be available within `timeout` or the queue is full
+        """
+        wait = self.__reserve(tokens, timeout)
+        if wait is None:
+            return False
+        if wait > 0.0:
+            try:
+                time.sleep(wait)
+            finally:
+                with self.__lock:
+                    self.__waiting -= 1
+        return True
+
+    def expected_wait(self, tokens: float=1) -> float:
+        """GET the seconds a caller would have to wait now"""
+        with self.__lock:
+            self.__refill()
+            return max(0.0, (tokens - self.__tokens) / self.rate)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {"rate": self.rate, "waiting": self.__waiting, "acquired": self.acquired, "rejected": self.rejected}
+
+    def __reserve(self, tokens: float, timeout: float) -> float:
+        """Reserves tokens, the bucket goes negative for the callers waiting in the queue
+            :Returns:
+                the seconds until the reserved tokens are available or `None` if rejected
+        """
+        with self.__lock:
+            self.__refill()
+            wait = max(0.0, (tokens - self.__tokens) / self.rate)
+            if (timeout is not None and wait > timeout) or \
+                    (wait > 0.0 and self.max_queue is not None and self.__waiting >= self.max_queue):
+                self.rejected += 1
+                return None
+            self.__tokens -= tokens
+            self.acquired += 1
+            if wait > 0.0:
+                self.__waiting += 1
+            return wait
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__tokens = min(float(self.burst), self.__tokens + (now - self.__updated_at) * self.rate)
+        self.__updated_at = now
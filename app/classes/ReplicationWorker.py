@@ -0,0 +1,218 @@
+import datetime
+import gzip
+import io
+import logging
+import os
+import sys
+import threading
+import xml.etree.ElementTree as etree
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.Database import ReplicationState
+from classes.UpstreamClient import upstream, UpstreamError
+from classes.Way import WayBatch
+from helpers.osm_helpers import is_building_without_housenumber
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicationWorker(object):
+
+    def __init__(self, store, session_factory, directory: str=None, name: str="buildings", interval: int=60, start_sequence: int=None):
+        """Keeps the building store up to date by applying osmChange (.osc) replication diffs
+            :Properties:
+                - `store` - the `BuildingStore`
+                - `session_factory` - a sqlalchemy `sessionmaker`, for the applied sequence number
+                - `directory` - local replication directory (optional - without directory the `replication` upstream endpoint is used)
+                - `name` - name of the replication stream
+                - `interval` - seconds between two checks for new diffs
+                - `start_sequence` - first sequence to apply if nothing was applied yet (optional - default is the current remote sequence)
+        """
+        self.__store = store
+        self.__session_factory = session_factory
+        self.__directory = directory
+        self.name = name
+        self.interval = interval
+        self.__start_sequence = start_sequence
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def applied_sequence(self):
+        """GET the last applied sequence number or `None`"""
+        session = self.__session_factory()
+        try:
+            state = session.query(ReplicationState).filter(ReplicationState.name == self.name).first()
+            return state.sequence if state is not None else None
+        finally:
+            session.close()
+
+    def remote_sequence(self) -> int:
+        """GET the newest available sequence number (from state.txt)"""
+        for line in self.__read("state.txt").decode("utf-8").splitlines():
+            if line.startswith("sequenceNumber="):
+                return int(line.split("=", 1)[1])
+        raise ValueError("no sequenceNumber in state.txt")
+
+    def run_once(self) -> int:
+        """Applies all new diffs
+            :Returns:
+                the number of applied diffs
+        """
+        remote = self.remote_sequence()
+        current = self.applied_sequence()
+        if current is None:
+            if self.__start_sequence is None:
+                logger.warning("replication %s has no start sequence, starting at the remote sequence %s" % (self.name, remote))
+                self.__save_sequence(remote)
+                return 0
+            current = self.__start_sequence - 1
+
+        applied = 0
+        while current < remote and not self.__stopped.is_set():
+            current += 1
+            stats = self.apply_change(self.__read_diff(current))
+            # applying a diff twice is harmless, so the sequence is saved after the changes
+            self.__save_sequence(current)
+            applied += 1
+            logger.info("replication %s applied sequence %s: %s" % (self.name, current, stats))
+
+        return applied
+
+    def apply_change(self, data: bytes) -> dict:
+        """Applies an osmChange document to the building store
+            :Parameters:
+                - `data` - the (uncompressed) osmChange xml
+
+            :Returns:
+                a `dict` with the number of saved, deleted, moved and unresolved ways
+        """
+        nodes, ways = self.__parse_change(data)
+
+        deleted = [way_id for way_id, way in ways.items() if way is None or not is_building_without_housenumber(way[0])]
+        buildings = dict((way_id, way) for way_id, way in ways.items() if way is not None and is_building_without_housenumber(way[0]))
+
+        stored = self.__store.get_ways_by_id(list(buildings))
+        moved_nodes = dict((node_id, location) for node_id, location in nodes.items() if location is not None)
+        affected = self.__store.get_ways_by_nodes(list(moved_nodes))
+
+        # node coordinates: from the diff, else from stored ways
+        locations = {}
+        for way in list(stored.values()) + list(affected.values()):
+            locations.update(zip(way.node_ids, way.coordinates()))
+        locations.update(moved_nodes)
+        unknown = set(ref for tags, refs in buildings.values() for ref in refs if ref not in locations)
+        if unknown:
+            for way in self.__store.get_ways_by_nodes(list(unknown)).values():
+                for node_id, location in zip(way.node_ids, way.coordinates()):
+                    locations.setdefault(node_id, location)
+
+        batch = WayBatch()
+        unresolved = 0
+        for way_id, (tags, refs) in buildings.items():
+            if not all(ref in locations for ref in refs):
+                unresolved += 1
+                continue
+            way = batch.add(way_id, tags, refs, [locations[ref][0] for ref in refs], [locations[ref][1] for ref in refs])
+            previous = stored.get(way_id)
+            if previous is not None and list(previous.node_ids) == refs and list(previous.coordinates()) == list(way.coordinates()):
+                way.centroid = previous.centroid
+
+        # unchanged ways with moved nodes, only their geometry is updated
+        moved = 0
+        for way_id, way in affected.items():
+            if way_id in ways:
+                continue
+            coordinates = [moved_nodes.get(node_id, location) for node_id, location in zip(way.node_ids, way.coordinates())]
+            if coordinates == list(way.coordinates()):
+                continue
+            batch.add(way_id, way.tags, way.node_ids, [lat for lat, lon in coordinates], [lon for lat, lon in coordinates])
+            moved += 1
+
+        # only for new or moved geometries
+        batch.calculate_centroids(missing_only=True)
+        updated = batch.ways
+
+        self.__store.delete_ways(deleted)
+        self.__store.save_ways(updated)
+
+        return {"saved": len(updated), "deleted": len(deleted), "moved": moved, "unresolved": unresolved}
+
+    def start(self):
+        """Starts the worker thread"""
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name="replication-%s" % self.name)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("replication %s failed" % self.name)
+            self.__stopped.wait(self.interval)
+
+    def __parse_change(self, data: bytes) -> tuple:
+        """Parses an osmChange document
+            :Returns:
+                a `tuple` (nodes, ways), node id -> (lat, lon) and way id -> (tags, node ids), `None` for deleted elements
+        """
+        nodes = {}
+        ways = {}
+        action = None
+        for event, element in etree.iterparse(io.BytesIO(data), events=("start", "end")):
+            if event == "start":
+                if element.tag in ("create", "modify", "delete"):
+                    action = element.tag
+                continue
+
+            if element.tag == "node":
+                if action == "delete":
+                    nodes[int(element.get("id"))] = None
+                else:
+                    nodes[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+            elif element.tag == "way":
+                if action == "delete":
+                    ways[int(element.get("id"))] = None
+                else:
+                    tags = dict((tag.get("k"), tag.get("v")) for tag in element.iter("tag"))
+                    ways[int(element.get("id"))] = (tags, [int(nd.get("ref")) for nd in element.iter("nd")])
+            elif element.tag not in ("relation", "create", "modify", "delete"):
+                continue
+            element.clear()
+
+        return nodes, ways
+
+    def __read_diff(self, sequence: int) -> bytes:
+        """Reads the diff of a sequence number (AAA/BBB/CCC.osc.gz layout)"""
+        path = "%03d/%03d/%03d.osc.gz" % (sequence // 1000000, sequence // 1000 % 1000, sequence % 1000)
+        return gzip.decompress(self.__read(path))
+
+    def __read(self, path: str) -> bytes:
+        if self.__directory is not None:
+            with open(os.path.join(self.__directory, path), "rb") as handle:
+                return handle.read()
+
+        response = upstream.get("replication", "/" + path)
+        if response.status_code != 200:
+            raise UpstreamError("replication responded with status %s for %s" % (response.status_code, path))
+        return response.content
+
+    def __save_sequence(self, sequence: int):
+        session = self.__session_factory()
+        try:
+            state = session.query(ReplicationState).filter(ReplicationState.name == self.name).first()
+            if state is None:
+                state = ReplicationState(name=self.name)
+            state.sequence = sequence
+            state.updated_at = datetime.datetime.utcnow()
+            session.add(state)
+            session.commit()
+        finally:
+            session.close()
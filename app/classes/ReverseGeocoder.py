@@ -0,0 +1,124 @@
+import datetime
+import json
+import logging
+import threading
+import sys
+import os
+from math import floor
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.Database import ReverseGeocodeCell
+from classes.SingleFlight import SingleFlight
+from classes.TTLCache import TTLCache
+from helpers.geo_helpers import reverse_geocode
+
+logger = logging.getLogger(__name__)
+
+
+class ReverseGeocoder(object):
+
+    def __init__(self, geocode=reverse_geocode, cell_size: float=0.0005, max_cells: int=50000, ttl: int=86400,
+                 session_factory=None, persist_ttl: int=2592000):
+        """Reverse geocoding with a cache per spatial cell, neighbouring buildings share street, city and postcode
+            :Properties:
+                - `geocode` - the uncached reverse geocoding function (lat, lon) -> address `dict`
+                - `cell_size` - edge length of the cells in degrees (coordinates are snapped to the cell grid)
+                - `max_cells` - max cells in the in-process cache (LRU)
+                - `ttl` - seconds until a cell expires in the in-process cache
+                - `session_factory` - a sqlalchemy `sessionmaker` to persist the cells (optional)
+                - `persist_ttl` - seconds until a persisted cell is outdated
+        """
+        self.__geocode = geocode
+        self.cell_size = cell_size
+        self.__cache = TTLCache(max_size=max_cells, ttl=ttl)
+        self.__session_factory = session_factory
+        self.persist_ttl = persist_ttl
+        self.__flights = SingleFlight()
+        self.__lock = threading.Lock()
+        self.persisted_hits = 0
+        self.upstream_requests = 0
+
+    def reverse(self, lat: float, lon: float) -> dict:
+        """Reverse geocodes a location
+            :Parameters:
+                - `lat` - Latitude
+                - `lon` - Longitude
+
+            :Returns:
+                the address `dict` (shared with other callers, don´t mutate it)
+        """
+        cell = self.cell(lat, lon)
+        address = self.__cache.get(cell)
+        if address is not None:
+            return address
+        # concurrent lookups of the same cell are sent only once
+        return self.__flights.do(cell, self.__load, cell, float(lat), float(lon))
+
+    def cached(self, lat: float, lon: float) -> dict:
+        """GET the address of a location from the in-memory cache, without geocoding, a probe which isn´t counted
+        in the cache stats, `reverse` counts the lookup
+            :Returns:
+                the address `dict` or `None`
+        """
+        return self.__cache.peek(self.cell(lat, lon))
+
+    def cell(self, lat: float, lon: float) -> str:
+        """GET the key of the cell containing a location"""
+        return "%s:%s:%s" % (self.cell_size, int(floor(float(lat) / self.cell_size)), int(floor(float(lon) / self.cell_size)))
+
+    def __load(self, cell: str, lat: float, lon: float) -> dict:
+        address = self.__load_persisted(cell)
+        if address is not None:
+            with self.__lock:
+                self.persisted_hits += 1
+        else:
+            with self.__lock:
+                self.upstream_requests += 1
+            address = self.__geocode(lat, lon)
+            self.__persist(cell, address)
+
+        self.__cache.set(cell, address)
+        return address
+
+    def __load_persisted(self, cell: str) -> dict:
+        if self.__session_factory is None:
+            return None
+
+        session = self.__session_factory()
+        try:
+            row = session.query(ReverseGeocodeCell).filter(
+                ReverseGeocodeCell.cell == cell,
+                ReverseGeocodeCell.created_at >= datetime.datetime.utcnow() - datetime.timedelta(seconds=self.persist_ttl)).first()
+            return json.loads(row.address) if row is not None else None
+        except Exception:
+            # the cache is optional, the lookup falls back to the geocoder
+            logger.warning("loading reverse geocode cell %s failed" % cell, exc_info=True)
+            return None
+        finally:
+            session.close()
+
+    def __persist(self, cell: str, address: dict):
+        if self.__session_factory is None:
+            return
+
+        session = self.__session_factory()
+        try:
+            session.merge(ReverseGeocodeCell(cell=cell, address=json.dumps(address), created_at=datetime.datetime.utcnow()))
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.warning("persisting reverse geocode cell %s failed" % cell, exc_info=True)
+        finally:
+            session.close()
+
+    def stats(self) -> dict:
+        """Cache statistics
+            :Returns:
+                a `dict` with the in-process cache stats, persisted hits, upstream requests and the total hit ratio
+        """
+        cache = self.__cache.stats()
+        lookups = cache["hits"] + self.persisted_hits + self.upstream_requests
+        return {"cache": cache, "persisted_hits": self.persisted_hits, "upstream_requests": self.upstream_requests,
+                "hit_ratio": float(cache["hits"] + self.persisted_hits) / lookups if lookups else 0.0,
+                "single_flight": self.__flights.stats()}
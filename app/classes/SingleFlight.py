@@ -0,0 +1,65 @@
+import threading
+
+
+class _Call(object):
+    """A running call, waiting callers block on `done`"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        """Coalesces identical concurrent calls: while a call with the same key is in flight,
+        later callers wait for its result instead of running their own"""
+        self.__lock = threading.Lock()
+        self.__calls = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Runs `func` once per key at a time
+            :Parameters:
+                - `key` - canonical (hashable) key of the call
+                - `func` - the function to call, with `args` and `kwargs`
+
+            :Returns:
+                the result of `func`, shared between all coalesced callers (don´t mutate it)
+        """
+        with self.__lock:
+            self.calls += 1
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.__calls[key] = _Call()
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self) -> dict:
+        """Counters
+            :Returns:
+                a `dict` with calls, deduplicated calls and calls in flight
+        """
+        return {"calls": self.calls, "deduplicated": self.deduplicated, "in_flight": len(self.__calls)}
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+
+    def __init__(self, max_size: int=1024, ttl: int=600):
+        """Threadsafe in-process cache with time to live and LRU eviction
+            :Properties:
+                - `max_size` - max number of entries, the least recently used entry is evicted first
+                - `ttl` - seconds until an entry expires
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """GET a cached value
+            :Parameters:
+                - `key` - the cache key
+                - `default` - returned if the key is unknown or expired
+
+            :Returns:
+                the cached value or `default`
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return default
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key, default=None):
+        """GET a cached value without counting a hit or miss and without refreshing its LRU position
+            :Parameters:
+                - `key` - the cache key
+                - `default` - returned if the key is unknown or expired
+
+            :Returns:
+                the cached value or `default`
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.time():
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl: int=None):
+        """Stores a value
+            :Parameters:
+                - `key` - the cache key
+                - `value` - the value
+                - `ttl` - overrides the default time to live (optional)
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        with self.__lock:
+            self.__entries[key] = (time.time() + ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def replace(self, key, value) -> bool:
+        """Replaces the value of a cached entry, keeping its expiry time
+            :Returns:
+                `False` if the key is unknown or expired
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.time():
+                return False
+            self.__entries[key] = (entry[0], value)
+            return True
+
+    def pop(self, key, default=None):
+        """Removes an entry
+            :Returns:
+                the removed value or `default`
+        """
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                return default
+            return entry[1]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __contains__(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            return entry is not None and entry[0] >= time.time()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def stats(self) -> dict:
+        """Cache statistics
+            :Returns:
+                a `dict` with size, hits, misses, hit ratio and evictions
+        """
+        lookups = self.hits + self.misses
+        return {"size": len(self.__entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": float(self.hits) / lookups if lookups else 0.0, "evictions": self.evictions}
@@ -0,0 +1,112 @@
+import logging
+import threading
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from helpers.geo_helpers import tile_range, bbox_around
+
+logger = logging.getLogger(__name__)
+
+
+class TilePrefetcher(object):
+
+    def __init__(self, overpass, rings: int=1, workers: int=2, max_pending: int=64, rate_limiter=None, tiles_per_request: int=16):
+        """Background prefetch of the quadtiles around served requests, users pan outward from their position
+            :Properties:
+                - `overpass` - the `OverpassApi` (with tile cache or building store)
+                - `rings` - number of tile rings around the requested tiles
+                - `workers` - max concurrent prefetches (global limit, prefetching never takes more upstream requests)
+                - `max_pending` - max queued and running tiles, further tiles are dropped
+                - `rate_limiter` - a `RateLimiter`, one token per overpass query, batches without token are dropped (optional)
+                - `tiles_per_request` - max tiles loaded with one overpass query
+        """
+        self.__overpass = overpass
+        self.rings = rings
+        self.max_pending = max_pending
+        self.tiles_per_request = tiles_per_request
+        self.__rate_limiter = rate_limiter
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.__lock = threading.Lock()
+        self.__pending = set()
+        self.queued = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.fetched = 0
+        self.failed = 0
+
+    def prefetch_bbox(self, bbox: dict):
+        """Queues the neighbour tiles of a bbox, nearest first. The ring is loaded in chunks of neighbouring tiles
+        (parts of the tile rows and columns along the bbox, one overpass query each)
+            :Parameters:
+                - `bbox` - the served searcharea
+        """
+        # large searchareas aren´t tiled, so their neighbours aren´t either
+        if not self.__overpass.is_tiled(bbox):
+            return
+
+        zoom = self.__overpass.tile_zoom
+        min_x, min_y, max_x, max_y = tile_range(bbox, zoom)
+        center_x = (min_x + max_x) / 2.0
+        center_y = (min_y + max_y) / 2.0
+
+        n = 2 ** zoom
+        left = max(min_x - self.rings, 0)
+        right = min(max_x + self.rings, n - 1)
+        top = max(min_y - self.rings, 0)
+        bottom = min(max_y + self.rings, n - 1)
+        # the rows above and below (with the corners) and the columns beside the bbox
+        lines = [[(x, y) for x in range(left, right + 1)] for y in list(range(top, min_y)) + list(range(max_y + 1, bottom + 1))]
+        lines += [[(x, y) for y in range(min_y, max_y + 1)] for x in list(range(left, min_x)) + list(range(max_x + 1, right + 1))]
+
+        chunks = [line[i:i + self.tiles_per_request] for line in lines for i in range(0, len(line), self.tiles_per_request)]
+        chunks.sort(key=lambda chunk: min((x - center_x) ** 2 + (y - center_y) ** 2 for x, y in chunk))
+        for chunk in chunks:
+            self.__submit(chunk)
+
+    def prefetch_around(self, lat: float, lon: float, radius: int):
+        """Queues the neighbour tiles of a radius search"""
+        self.prefetch_bbox(bbox_around(lat, lon, radius))
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=False)
+
+    def __submit(self, tiles: list):
+        with self.__lock:
+            batch = []
+            for tile in tiles:
+                if tile in self.__pending:
+                    self.deduplicated += 1
+                elif len(self.__pending) >= self.max_pending:
+                    self.dropped += 1
+                else:
+                    self.__pending.add(tile)
+                    batch.append(tile)
+            if not batch:
+                return
+            self.queued += len(batch)
+        self.__executor.submit(self.__prefetch, batch)
+
+    def __prefetch(self, tiles: list):
+        try:
+            # prefetching gets its own budget, foreground requests aren´t limited
+            fetched = self.__overpass.load_tiles(tiles, rate_limiter=self.__rate_limiter)
+            with self.__lock:
+                self.fetched += fetched
+        except Exception:
+            with self.__lock:
+                self.failed += len(tiles)
+            logger.warning("prefetch of tiles %s failed" % (tiles,), exc_info=True)
+        finally:
+            with self.__lock:
+                self.__pending.difference_update(tiles)
+
+    def stats(self) -> dict:
+        """Counters
+            :Returns:
+                a `dict` with queued, deduplicated, dropped, fetched and failed tiles and the tiles in flight
+        """
+        return {"queued": self.queued, "deduplicated": self.deduplicated, "dropped": self.dropped, "fetched": self.fetched,
+                "failed": self.failed, "in_flight": len(self.__pending)}
@@ -0,0 +1,217 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.RateLimiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """An upstream call failed (after all retries)"""
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    """The upstream is considered down, the call wasn´t sent"""
+    pass
+
+
+class RateLimitedError(UpstreamError):
+    """The rate limit of the upstream wouldn´t allow the call in time, the call wasn´t sent"""
+    pass
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, failure_threshold: int=5, reset_timeout: int=30):
+        """Fails fast after `failure_threshold` failed calls in a row, lets one trial call pass after `reset_timeout` seconds
+            :Properties:
+                - `failure_threshold` - failed calls until the circuit opens
+                - `reset_timeout` - seconds until a trial call is allowed again
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.__lock = threading.Lock()
+        self.__failures = 0
+        self.__opened_at = None
+        self.__trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.__opened_at is None:
+            return "closed"
+        if time.time() - self.__opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """True if a call may be sent"""
+        with self.__lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.__trial_running:
+                self.__trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.__lock:
+            self.__failures = 0
+            self.__opened_at = None
+            self.__trial_running = False
+
+    def record_failure(self):
+        with self.__lock:
+            self.__failures += 1
+            self.__trial_running = False
+            if self.__failures >= self.failure_threshold:
+                self.__opened_at = time.time()
+
+
+class UpstreamClient(object):
+
+    def __init__(self, endpoints: dict, pool_size: int=20):
+        """Shared HTTP client for all upstream apis: keep-alive connection pool, timeouts, retries with backoff, a circuit breaker
+        and an optional rate limit per endpoint
+            :Properties:
+                - `endpoints` - a `dict` name -> endpoint config (`url`, `timeout`, `retries`, `backoff`, `failure_threshold`, `reset_timeout`,
+                  rate limit: `rate` requests per second, `burst`, `max_queue` waiting calls, `max_wait` seconds)
+                - `pool_size` - max connections kept alive per host
+        """
+        self.__session = requests.Session()
+        self.configure(endpoints, pool_size)
+
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def configure(self, endpoints: dict, pool_size: int=20):
+        """(Re)configures the endpoints
+            :Parameters:
+                - `endpoints` - a `dict` name -> endpoint config
+                - `pool_size` - max connections kept alive per host
+        """
+        adapter = HTTPAdapter(pool_connections=max(len(endpoints), 1), pool_maxsize=pool_size)
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+        self.__endpoints = {}
+        self.__breakers = {}
+        self.__limiters = {}
+        for name, endpoint in endpoints.items():
+            endpoint = dict({"timeout": 10, "retries": 2, "backoff": 0.5, "failure_threshold": 5, "reset_timeout": 30,
+                             "rate": None, "burst": 1, "max_queue": None, "max_wait": None}, **endpoint)
+            self.__endpoints[name] = endpoint
+            self.__breakers[name] = CircuitBreaker(endpoint["failure_threshold"], endpoint["reset_timeout"])
+            if endpoint["rate"]:
+                self.__limiters[name] = RateLimiter(endpoint["rate"], endpoint["burst"], endpoint["max_queue"])
+
+    def request(self, endpoint: str, method: str, path: str="", session=None, idempotent: bool=None, max_wait: float=None, **kwargs):
+        """Sends a request to an upstream
+            :Parameters:
+                - `endpoint` - name of the endpoint
+                - `method` - the http method
+                - `path` - appended to the endpoint url (passed unchanged if an own `session` is used)
+                - `session` - an own `requests.Session`, e.g. an oauth session (optional)
+                - `idempotent` - retry failed calls (default: only for GET/HEAD/OPTIONS)
+                - `max_wait` - max seconds to wait for the rate limit of the endpoint (default: `max_wait` of the endpoint)
+                - `kwargs` - passed to `requests`
+
+            :Returns:
+                the `requests.Response`
+
+            :Raises:
+                `CircuitOpenError` if the upstream is down, `RateLimitedError` if the rate limit doesn´t allow the call in time,
+                `UpstreamError` if all attempts failed
+        """
+        config = self.__endpoints[endpoint]
+        breaker = self.__breakers[endpoint]
+        limiter = self.__limiters.get(endpoint)
+        if max_wait is None:
+            max_wait = config["max_wait"]
+
+        if breaker.state == "open":
+            raise CircuitOpenError("%s is unavailable" % endpoint)
+        # the rate limit is waited for before a trial call of a half-open circuit is claimed
+        if limiter is not None and not limiter.acquire(timeout=max_wait):
+            raise RateLimitedError("%s is rate limited" % endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError("%s is unavailable" % endpoint)
+
+        if session is None:
+            session = self.__session
+            url = config["url"] + path
+        else:
+            url = path
+
+        if idempotent is None:
+            idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        retries = config["retries"] if idempotent else 0
+        kwargs.setdefault("timeout", config["timeout"])
+
+        error = None
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                time.sleep(config["backoff"] * 2 ** (attempt - 1))
+                # retries count against the rate limit, too
+                if limiter is not None and not limiter.acquire(timeout=max_wait):
+                    break
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code not in self.RETRY_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+                error = UpstreamError("%s responded with status %s" % (endpoint, response.status_code))
+            logger.warning("upstream %s attempt %s failed: %s" % (endpoint, attempt + 1, error))
+
+        breaker.record_failure()
+        raise UpstreamError("%s failed: %s" % (endpoint, error))
+
+    def get(self, endpoint: str, path: str="", **kwargs):
+        return self.request(endpoint, "GET", path, **kwargs)
+
+    def post(self, endpoint: str, path: str="", **kwargs):
+        return self.request(endpoint, "POST", path, **kwargs)
+
+    def put(self, endpoint: str, path: str="", **kwargs):
+        return self.request(endpoint, "PUT", path, **kwargs)
+
+    def stats(self) -> dict:
+        """Circuit breaker states
+            :Returns:
+                a `dict` endpoint -> state
+        """
+        return dict((name, breaker.state) for name, breaker in self.__breakers.items())
+
+    def expected_wait(self, endpoint: str) -> float:
+        """GET the seconds a call to an endpoint would wait for its rate limit now"""
+        limiter = self.__limiters.get(endpoint)
+        return limiter.expected_wait() if limiter is not None else 0.0
+
+    def rate_limit_stats(self) -> dict:
+        """Rate limit counters
+            :Returns:
+                a `dict` endpoint -> waiting, acquired and rejected calls
+        """
+        return dict((name, limiter.stats()) for name, limiter in self.__limiters.items())
+
+
+DEFAULT_ENDPOINTS = {
+    "overpass": {"url": "http://www.overpass-api.de/api/interpreter", "timeout": 30, "retries": 1},
+    "nominatim": {"url": "http://nominatim.openstreetmap.org", "timeout": 5, "rate": 1, "max_queue": 20, "max_wait": 5},
+    "osm_api": {"url": "https://api.openstreetmap.org", "timeout": 15},
+}
+
+# the shared client, reconfigured by the app from settings.UPSTREAMS
+upstream = UpstreamClient(DEFAULT_ENDPOINTS)
@@ -0,0 +1,144 @@
+import datetime
+import logging
+import threading
+import sys
+import os
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.Database import WarmupState
+from helpers.geo_helpers import lat_lon_to_tile
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupScheduler(object):
+
+    def __init__(self, overpass, session_factory, regions: list, interval: int=21600, rate_limiter=None, tiles_per_request: int=4):
+        """Walks configured regions tile by tile and loads them into the caches of the `OverpassApi`, at startup and then every `interval`
+            :Properties:
+                - `overpass` - the `OverpassApi` (with tile cache or building store)
+                - `session_factory` - a sqlalchemy `sessionmaker`, for the progress per region
+                - `regions` - a `list` of `dict` with name, north, south, east, west
+                - `interval` - seconds between two warm-ups of a region
+                - `rate_limiter` - a `RateLimiter`, one token per overpass query (optional)
+                - `tiles_per_request` - max tiles loaded with one overpass query
+        """
+        self.__overpass = overpass
+        self.__session_factory = session_factory
+        self.regions = regions
+        self.interval = interval
+        self.__rate_limiter = rate_limiter
+        self.tiles_per_request = tiles_per_request
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.fetched = 0
+
+    def run_once(self) -> int:
+        """Warms up all regions which are due, resumes unfinished ones
+            :Returns:
+                the number of tiles fetched from overpass
+        """
+        fetched = 0
+        for region in self.regions:
+            if self.__stopped.is_set():
+                break
+            fetched += self.warm_region(region)
+        return fetched
+
+    def warm_region(self, region: dict) -> int:
+        """Warms up a region if it is due, the progress is saved after every tile batch
+            :Parameters:
+                - `region` - a `dict` with name, north, south, east, west
+
+            :Returns:
+                the number of tiles fetched from overpass
+        """
+        batches = self.__batches(region)
+        state = self.__load_state(region["name"])
+
+        if state["batches"] != len(batches):
+            # new or changed region
+            state = {"position": 0, "batches": len(batches), "started_at": None, "completed_at": None}
+        elif state["position"] >= len(batches):
+            if state["completed_at"] is not None and state["completed_at"] + datetime.timedelta(seconds=self.interval) > datetime.datetime.utcnow():
+                return 0
+            state["position"] = 0
+
+        if state["position"] == 0:
+            state["started_at"] = datetime.datetime.utcnow()
+            state["completed_at"] = None
+            logger.info("warm-up of %s started, %s tile batches" % (region["name"], len(batches)))
+        else:
+            logger.info("warm-up of %s resumed at tile batch %s of %s" % (region["name"], state["position"], len(batches)))
+
+        fetched = 0
+        while state["position"] < len(batches) and not self.__stopped.is_set():
+            # cached batches don´t take a token
+            fetched += self.__overpass.load_tiles(batches[state["position"]], rate_limiter=self.__rate_limiter, wait=True)
+            state["position"] += 1
+            if state["position"] == len(batches):
+                state["completed_at"] = datetime.datetime.utcnow()
+            self.__save_state(region["name"], state)
+
+        self.fetched += fetched
+        if state["completed_at"] is not None:
+            logger.info("warm-up of %s completed, %s tiles fetched" % (region["name"], fetched))
+        return fetched
+
+    def start(self):
+        """Starts the scheduler thread"""
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name="warmup")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("warm-up failed")
+            # regions are checked more often than the interval, so a failed batch is retried soon
+            self.__stopped.wait(min(self.interval, 300))
+
+    def __batches(self, region: dict) -> list:
+        """Splits the tiles of a region into batches of neighbouring tiles (parts of a tile row)"""
+        zoom = self.__overpass.tile_zoom
+        min_x, min_y = lat_lon_to_tile(region["north"], region["west"], zoom)
+        max_x, max_y = lat_lon_to_tile(region["south"], region["east"], zoom)
+        return [[(x, y) for x in range(start, min(start + self.tiles_per_request, max_x + 1))]
+                for y in range(min_y, max_y + 1) for start in range(min_x, max_x + 1, self.tiles_per_request)]
+
+    def __load_state(self, name: str) -> dict:
+        session = self.__session_factory()
+        try:
+            state = session.query(WarmupState).filter(WarmupState.name == name).first()
+            if state is None:
+                return {"position": 0, "batches": None, "started_at": None, "completed_at": None}
+            return {"position": state.position, "batches": state.batches, "started_at": state.started_at, "completed_at": state.completed_at}
+        finally:
+            session.close()
+
+    def __save_state(self, name: str, values: dict):
+        session = self.__session_factory()
+        try:
+            state = session.query(WarmupState).filter(WarmupState.name == name).first()
+            if state is None:
+                state = WarmupState(name=name)
+            state.position = values["position"]
+            state.batches = values["batches"]
+            state.started_at = values["started_at"]
+            state.completed_at = values["completed_at"]
+            session.add(state)
+            session.commit()
+        finally:
+            session.close()
+
+    def stats(self) -> dict:
+        return {"regions": len(self.regions), "fetched": self.fetched}
@@ -0,0 +1,212 @@
+import json
+import os
+import sys
+from array import array
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from helpers.geo_batch import batch_centroids, polygon_centroid
+from helpers.polyline import encode_polyline
+from helpers.simplify import simplify_indices
+
+
+class WayBatch(object):
+    """Shared coordinate and node id buffers of many ways (e.g. of one overpass response)"""
+    __slots__ = ("lats", "lons", "node_ids", "ways")
+
+    def __init__(self):
+        self.lats = array("d")
+        self.lons = array("d")
+        self.node_ids = array("q")
+        self.ways = []
+
+    def add(self, way_id: int, tags: dict, node_ids, lats, lons, centroid: tuple=None, version: int=None):
+        """Appends a way to the buffers
+            :Parameters:
+                - `way_id` - osm id of the way
+                - `tags` - the tags
+                - `node_ids`, `lats`, `lons` - sequences with the node ids and coordinates
+                - `centroid` - (lat, lon) `tuple` (optional - see `calculate_centroids`)
+                - `version` - osm version of the way (optional)
+
+            :Returns:
+                the `Way`
+        """
+        start = len(self.node_ids)
+        self.node_ids.extend(node_ids)
+        self.lats.extend(lats)
+        self.lons.extend(lons)
+        way = Way(way_id, tags, self, start, len(self.node_ids), centroid, version)
+        self.ways.append(way)
+        return way
+
+    def calculate_centroids(self, missing_only: bool=False):
+        """Calculates the centroids of all ways of the batch in one pass
+            :Parameters:
+                - `missing_only` - only for ways without centroid (one by one)
+        """
+        if missing_only:
+            for way in self.ways:
+                if way.centroid is None:
+                    way.centroid = polygon_centroid(way.lats, way.lons)
+            return
+
+        offsets = [way.start for way in self.ways] + [len(self.node_ids)]
+        for way, centroid in zip(self.ways, batch_centroids(self.lats, self.lons, offsets)):
+            way.centroid = centroid
+
+
+class Way(object):
+    """Compact way, the nodes are a slice of the buffers of a `WayBatch`"""
+    __slots__ = ("id", "tags", "batch", "start", "end", "centroid", "version", "simplified", "fragments")
+
+    # max simplified outlines and encoded fragments kept per way
+    MAX_VARIANTS = 8
+
+    def __init__(self, way_id: int, tags: dict, batch: WayBatch, start: int, end: int, centroid: tuple=None, version: int=None):
+        self.id = way_id
+        self.tags = tags
+        self.batch = batch
+        self.start = start
+        self.end = end
+        self.centroid = centroid
+        self.version = version
+        # tolerance -> simplified `Way`, lives as long as the way (e.g. in the tile cache)
+        self.simplified = None
+        # (geometry, fields) -> encoded JSON, see `to_json`
+        self.fragments = None
+
+    @property
+    def node_ids(self) -> array:
+        return self.batch.node_ids[self.start:self.end]
+
+    @property
+    def lats(self) -> array:
+        return self.batch.lats[self.start:self.end]
+
+    @property
+    def lons(self) -> array:
+        return self.batch.lons[self.start:self.end]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def coordinates(self):
+        """Iterates the (lat, lon) tuples of the nodes"""
+        return zip(self.lats, self.lons)
+
+    def nodes(self) -> list:
+        """GET the node `list` in the api format"""
+        return [{"lat": lat, "lon": lon, "id": node_id} for node_id, lat, lon in zip(self.node_ids, self.lats, self.lons)]
+
+    def simplify(self, tolerance: float):
+        """GET the way with a simplified outline (cached for up to `MAX_VARIANTS` tolerances), the centroid isn´t changed
+            :Parameters:
+                - `tolerance` - max deviation in meters
+
+            :Returns:
+                a `Way` (this one, if no node can be removed)
+        """
+        simplified = self.simplified
+        if simplified is None:
+            simplified = self.simplified = {}
+
+        way = simplified.get(tolerance)
+        if way is None:
+            node_ids = self.node_ids
+            lats = self.lats
+            lons = self.lons
+            keep = simplify_indices(lats, lons, tolerance)
+            if len(keep) == len(self):
+                way = self
+            else:
+                way = WayBatch().add(self.id, self.tags, [node_ids[i] for i in keep], [lats[i] for i in keep], [lons[i] for i in keep],
+                                     self.centroid, self.version)
+            # clients choose the tolerance, only the first ones are kept
+            if len(simplified) < self.MAX_VARIANTS:
+                simplified[tolerance] = way
+        return way
+
+    def with_tags(self, tags: dict, version: int=None):
+        """GET a copy with other tags (and version), sharing the node buffers"""
+        return Way(self.id, tags, self.batch, self.start, self.end, self.centroid, version if version is not None else self.version)
+
+    def to_json(self, geometry: str="nodes", fields: tuple=None) -> str:
+        """Encodes the way as JSON (see `to_dict`), the encoded ways are kept as long as the way (e.g. in the tile cache)"""
+        fragments = self.fragments
+        if fragments is None:
+            fragments = self.fragments = {}
+
+        key = (geometry, fields)
+        encoded = fragments.get(key)
+        if encoded is None:
+            encoded = json.dumps(self.to_dict(geometry=geometry, fields=fields))
+            if len(fragments) < self.MAX_VARIANTS:
+                fragments[key] = encoded
+        return encoded
+
+    def to_dict(self, distance: float=None, geometry: str="nodes", fields=None) -> dict:
+        """Converts the way to the api format
+            :Parameters:
+                - `distance` - distance to the user (optional)
+                - `geometry` - `nodes` for a node `list`, `polyline` for the compact format (encoded polyline6 and the node ids)
+                - `fields` - the attributes to include, `nodes` stands for the geometry (optional - default all),
+                  the geometry is only expanded if requested
+        """
+        result = {}
+        if fields is None or "type" in fields:
+            result["type"] = "way"
+        if fields is None or "id" in fields:
+            result["id"] = self.id
+        if fields is None or "tags" in fields:
+            result["tags"] = self.tags
+        if fields is None or "centroid" in fields:
+            result["centroid"] = {"lat": self.centroid[0], "lon": self.centroid[1]} if self.centroid is not None else None
+        if fields is None or "nodes" in fields:
+            if geometry == "polyline":
+                result["polyline"] = encode_polyline(self.lats, self.lons)
+                result["node_ids"] = self.node_ids.tolist()
+            else:
+                result["nodes"] = self.nodes()
+        if self.version is not None and (fields is None or "version" in fields):
+            result["version"] = self.version
+        if distance is not None and (fields is None or "distance" in fields):
+            result["distance"] = distance
+        return result
+
+    @classmethod
+    def from_dict(cls, way: dict):
+        """Converts a way in the api format (with a node `list`)"""
+        batch = WayBatch()
+        centroid = (way["centroid"]["lat"], way["centroid"]["lon"]) if way.get("centroid") else None
+        result = batch.add(way["id"], way.get("tags", {}), [node["id"] for node in way["nodes"]],
+                           [node["lat"] for node in way["nodes"]], [node["lon"] for node in way["nodes"]], centroid, way.get("version"))
+        if centroid is None:
+            batch.calculate_centroids()
+        return result
+
+
+class WayResult(object):
+    """A way with its request specific attributes, converted to a `dict` only when the response is serialized"""
+    __slots__ = ("way", "distance")
+
+    def __init__(self, way: Way, distance: float=None):
+        self.way = way
+        self.distance = distance
+
+    def to_dict(self, geometry: str="nodes", fields=None) -> dict:
+        return self.way.to_dict(self.distance, geometry, fields)
+
+    def to_json(self, geometry: str="nodes", fields: tuple=None) -> str:
+        """Encodes the result as JSON, reusing the encoded way (see `Way.to_json`)
+            :Parameters:
+                - `geometry`, `fields` - see `Way.to_dict`
+        """
+        encoded = self.way.to_json(geometry, fields)
+
+        if self.distance is None or (fields is not None and "distance" not in fields):
+            return encoded
+        if encoded == "{}":
+            return '{"distance": %s}' % json.dumps(self.distance)
+        # the distance is request specific, so it is appended to the shared fragment
+        return '%s, "distance": %s}' % (encoded[:-1], json.dumps(self.distance))
@@ -0,0 +1,60 @@
+import threading
+import sys
+import os
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.TTLCache import TTLCache
+
+
+class WayCache(object):
+
+    def __init__(self, max_size: int=4096, ttl: int=300):
+        """Short lived cache of single ways by osm id, shared by the building lookup, the edit form and the edit itself
+            :Properties:
+                - `max_size` - max number of cached ways
+                - `ttl` - seconds until a way expires
+
+            Entries are version aware: a cached way is never replaced by an older version of it
+            (e.g. a lagging overpass result after an authoritative osm api read).
+        """
+        self.__cache = TTLCache(max_size=max_size, ttl=ttl)
+        self.__lock = threading.Lock()
+
+    def get(self, way_id: int):
+        """GET a cached `Way` or `None`"""
+        return self.__cache.get(int(way_id))
+
+    def set(self, way):
+        """Stores a `Way`, unless a newer version is cached
+            :Returns:
+                the cached `Way` (the given one or the newer cached one)
+        """
+        with self.__lock:
+            cached = self.__cache.get(way.id)
+            if cached is not None and self.__newer(cached.version, way.version):
+                return cached
+            self.__cache.set(way.id, way)
+            return way
+
+    def update_tags(self, way_id: int, version: int, tags: dict):
+        """Patches a cached way with the tags of a newer version (e.g. from the osm api), unknown ways are ignored
+            :Parameters:
+                - `way_id` - osm id of the way
+                - `version` - osm version of the tags
+                - `tags` - the tags
+        """
+        with self.__lock:
+            cached = self.__cache.get(int(way_id))
+            if cached is not None and self.__newer(version, cached.version):
+                self.__cache.set(cached.id, cached.with_tags(dict(tags), version))
+
+    def pop(self, way_id: int):
+        return self.__cache.pop(int(way_id))
+
+    def stats(self) -> dict:
+        return self.__cache.stats()
+
+    def __newer(self, version: int, other: int) -> bool:
+        """True if `version` is newer than `other`, unknown versions are never newer"""
+        return version is not None and (other is None or version > other)
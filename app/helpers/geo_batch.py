@@ -0,0 +1,134 @@
+from math import cos, radians, sin, asin, sqrt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS = 6371  # km
+
+
+def polygon_centroid(lats, lons) -> tuple:
+    """Centroid of one polygon (pure python)
+        `lats` - latitudes of the vertices
+        `lons` - longitudes of the vertices
+
+        :Returns:
+            a `tuple` (lat, lon), the mean of the vertices for degenerate (zero area) polygons
+    """
+    count = len(lats)
+    if count == 0:
+        return None
+    # relative to the first vertex, absolute coordinates lose precision for small polygons
+    lat0 = lats[0]
+    lon0 = lons[0]
+    area = 0.0
+    result_x = 0.0
+    result_y = 0.0
+    for i in range(count):
+        x0 = lats[i] - lat0
+        y0 = lons[i] - lon0
+        x1 = lats[(i + 1) % count] - lat0
+        y1 = lons[(i + 1) % count] - lon0
+        cross = (x0 * y1) - (x1 * y0)
+        area += cross
+        result_x += (x0 + x1) * cross
+        result_y += (y0 + y1) * cross
+
+    if area == 0.0:
+        return _vertex_mean(lats, lons)
+    area *= 3.0
+    return lat0 + result_x / area, lon0 + result_y / area
+
+
+def _vertex_mean(lats, lons) -> tuple:
+    count = len(lats)
+    if count > 1 and lats[0] == lats[-1] and lons[0] == lons[-1]:
+        # closed way, the first node is repeated
+        count -= 1
+    return sum(lats[:count]) / count, sum(lons[:count]) / count
+
+
+def batch_centroids(lats, lons, offsets) -> list:
+    """Centroids of all ways of a response in one pass
+        `lats` - flat sequence of the latitudes of all ways
+        `lons` - flat sequence of the longitudes of all ways
+        `offsets` - start index of every way in the flat sequences plus the total length at the end
+
+        :Returns:
+            a `list` of (lat, lon) tuples, one per way (`None` for ways without nodes)
+    """
+    if numpy is None or len(offsets) < 2:
+        return [polygon_centroid(lats[start:end], lons[start:end]) for start, end in zip(offsets, offsets[1:])]
+
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    lats = numpy.asarray(lats, dtype=numpy.float64)[offsets[0]:offsets[-1]]
+    lons = numpy.asarray(lons, dtype=numpy.float64)[offsets[0]:offsets[-1]]
+    offsets = offsets - offsets[0]
+    lengths = numpy.diff(offsets)
+    filled = numpy.flatnonzero(lengths > 0)
+    result = [None] * len(lengths)
+    if len(filled) == 0:
+        return result
+    starts = offsets[filled]
+    lengths = lengths[filled]
+
+    # coordinates relative to the first vertex of every way
+    way_index = numpy.repeat(numpy.arange(len(starts)), lengths)
+    x0 = lats - lats[starts][way_index]
+    y0 = lons - lons[starts][way_index]
+    # the successor of the last vertex is the first one
+    following = numpy.arange(1, len(lats) + 1)
+    following[starts + lengths - 1] = starts
+    x1 = x0[following]
+    y1 = y0[following]
+
+    cross = x0 * y1 - x1 * y0
+    area = numpy.bincount(way_index, weights=cross, minlength=len(starts)) * 3.0
+    sum_x = numpy.bincount(way_index, weights=(x0 + x1) * cross, minlength=len(starts))
+    sum_y = numpy.bincount(way_index, weights=(y0 + y1) * cross, minlength=len(starts))
+
+    degenerate = area == 0.0
+    safe_area = numpy.where(degenerate, 1.0, area)
+    centroid_lats = (lats[starts] + sum_x / safe_area).tolist()
+    centroid_lons = (lons[starts] + sum_y / safe_area).tolist()
+
+    for position, way in enumerate(filled.tolist()):
+        result[way] = (centroid_lats[position], centroid_lons[position])
+
+    for position in numpy.flatnonzero(degenerate).tolist():
+        start = int(starts[position])
+        end = start + int(lengths[position])
+        result[int(filled[position])] = _vertex_mean(lats[start:end].tolist(), lons[start:end].tolist())
+
+    return result
+
+
+def batch_distances(lat: float, lon: float, lats, lons) -> list:
+    """Haversine distances from one point to many points
+        `lat` - Latitude of the point
+        `lon` - Longitude of the point
+        `lats` - sequence of latitudes
+        `lons` - sequence of longitudes
+
+        :Returns:
+            a `list` of distances in km
+    """
+    if numpy is None:
+        return [_haversine(lat, lon, lat2, lon2) for lat2, lon2 in zip(lats, lons)]
+
+    lat1 = numpy.radians(lat)
+    lats = numpy.radians(numpy.asarray(lats, dtype=numpy.float64))
+    dlat = lats - lat1
+    dlon = numpy.radians(numpy.asarray(lons, dtype=numpy.float64)) - numpy.radians(lon)
+    a = numpy.sin(dlat / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lats) * numpy.sin(dlon / 2) ** 2
+    return (2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(a))).tolist()
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    lat1 = radians(lat1)
+    lat2 = radians(lat2)
+    dlat = lat2 - lat1
+    dlon = radians(lon2) - radians(lon1)
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(sqrt(a))
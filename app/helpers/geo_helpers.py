@@ -1,8 +1,16 @@
-import itertools
-from math import cos, radians, sin, pow, asin, sqrt
+from math import cos, radians, sin, pow, asin, sqrt, degrees, atan, sinh, log, tan, pi, floor
 import json
+import os
+import sys
 
-import requests
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.SingleFlight import SingleFlight
+from classes.UpstreamClient import upstream, UpstreamError
+from helpers.geo_batch import polygon_centroid
+
+# coalesces identical concurrent reverse geocoding requests
+reverse_geocode_flights = SingleFlight()
 
 
 def calculate_centroid(shape: list) -> dict:
@@ -10,26 +18,8 @@ def calculate_centroid(shape: list) -> dict:
         :Parameters:
         - `shape` -a list of lat/lon dicts a
     """
-
-    points = []
-    for node in shape:
-        points.append([node["lat"], node["lon"]])
-
-    area = area_of_polygon(*zip(*points))
-    result_x = 0
-    result_y = 0
-    N = len(points)
-    points = itertools.cycle(points)
-    x1, y1 = next(points)
-    for i in range(N):
-        x0, y0 = x1, y1
-        x1, y1 = next(points)
-        cross = (x0 * y1) - (x1 * y0)
-        result_x += (x0 + x1) * cross
-        result_y += (y0 + y1) * cross
-    result_x /= (area * 6.0)
-    result_y /= (area * 6.0)
-    return {"lat": result_x, "lon": result_y}
+    lat, lon = polygon_centroid([node["lat"] for node in shape], [node["lon"] for node in shape])
+    return {"lat": lat, "lon": lon}
 
 
 def area_of_polygon(x, y):
@@ -66,6 +56,86 @@ def geo_distance(lat1, long1, lat2, long2):
     return distance
 
 
+def lat_lon_to_tile(lat: float, lon: float, zoom: int) -> tuple:
+    """Find the quadtile (slippy map tile) containing a point
+        `lat` - Latitude
+        `lon` - Longitude
+        `zoom` - the tile zoom level
+
+        :Returns:
+            a `tuple` (x, y)
+    """
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int(floor((lon + 180.0) / 360.0 * n))
+    y = int(floor((1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0 * n))
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_to_bbox(x: int, y: int, zoom: int) -> dict:
+    """Calculates the bounding box of a quadtile
+        :Returns:
+            a bbox `dict` with north, south, east, west
+    """
+    n = 2 ** zoom
+
+    def tile_lat(tile_y):
+        return degrees(atan(sinh(pi * (1 - 2 * tile_y / n))))
+
+    return {"north": tile_lat(y), "south": tile_lat(y + 1), "west": x / n * 360.0 - 180.0, "east": (x + 1) / n * 360.0 - 180.0}
+
+
+def tile_range(bbox: dict, zoom: int) -> tuple:
+    """GET the range of quadtiles covering a bounding box
+        :Returns:
+            a `tuple` (min_x, min_y, max_x, max_y)
+    """
+    min_x, min_y = lat_lon_to_tile(bbox["north"], bbox["west"], zoom)
+    max_x, max_y = lat_lon_to_tile(bbox["south"], bbox["east"], zoom)
+    return min_x, min_y, max_x, max_y
+
+
+def count_tiles_for_bbox(bbox: dict, zoom: int) -> int:
+    """GET the number of quadtiles covering a bounding box, without building the list"""
+    min_x, min_y, max_x, max_y = tile_range(bbox, zoom)
+    return (max_x - min_x + 1) * (max_y - min_y + 1)
+
+
+def tiles_for_bbox(bbox: dict, zoom: int) -> list:
+    """GET all quadtiles covering a bounding box (see `count_tiles_for_bbox` to limit large areas first)
+        :Returns:
+            a `list` of (x, y) tuples
+    """
+    min_x, min_y, max_x, max_y = tile_range(bbox, zoom)
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def bbox_around(lat: float, lon: float, radius: float) -> dict:
+    """Calculates the bounding box of a circle
+        `lat` - Latitude
+        `lon` - Longitude
+        `radius` - radius in meters
+    """
+    delta_lat = degrees(radius / 6371000.0)
+    delta_lon = degrees(radius / (6371000.0 * max(cos(radians(lat)), 0.000001)))
+    return {"north": lat + delta_lat, "south": lat - delta_lat, "east": lon + delta_lon, "west": lon - delta_lon}
+
+
 def reverse_geocode(lat, lon):
     """Reversgeocode an adress atm. by using Nominatim"""
-    return requests.get("http://nominatim.openstreetmap.org/reverse?format=json&lat=%s&lon=%s&osm_type=way&email=felix@geo.io" % (lat, lon)).json()["address"]
+    return reverse_geocode_flights.do(("reverse", float(lat), float(lon)), _nominatim_reverse, lat, lon)
+
+
+def _nominatim_reverse(lat, lon):
+    params = {"format": "json", "lat": lat, "lon": lon, "osm_type": "way", "email": "felix@geo.io"}
+    response = upstream.get("nominatim", "/reverse", params=params)
+    if response.status_code != 200:
+        raise UpstreamError("nominatim responded with status %s" % response.status_code)
+
+    try:
+        data = response.json()
+    except ValueError:
+        raise UpstreamError("nominatim responded without JSON")
+    if not isinstance(data, dict) or "address" not in data:
+        raise UpstreamError("nominatim responded without address: %s" % (data.get("error") if isinstance(data, dict) else data))
+    return data["address"]
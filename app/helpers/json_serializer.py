@@ -1,33 +1,246 @@
 from bson import json_util
+import gzip
+import hashlib
+import itertools
 import json
+import zlib
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import bottle
 from bottle import request, response, route
 from bottle import install, uninstall
 
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
 
 class JSONAPIPlugin(object):
+    """Serializes dict responses, negotiated with the request:
+        - `Accept: application/msgpack` - MessagePack instead of JSON (if msgpack is installed)
+        - `Accept-Encoding: gzip/deflate` - compressed bodies above `compress_min_size` bytes
+        - `?geometry=polyline` - ways with an encoded polyline instead of the node `list`
+        - `?fields=id,centroid,distance` - only these attributes of the ways
+        - `?callback=` - JSONP
+        - `?stream=1` - chunked output, the results are written one by one (JSON only)
+
+    Lists of objects with a `to_json` method (e.g. `WayResult`) are encoded with their cached fragments, the rest of the
+    payload is encoded without the `json_util` hook as long as it contains only plain types.
+    Responses get a strong ETag (see `conditional_response`, else a hash of the body) and `If-None-Match` is answered with 304.
+    """
     name = 'jsonapi'
     api = 2
 
-    def __init__(self, json_dumps=json.dumps, json_util=json_util.default):
+    def __init__(self, json_dumps=json.dumps, json_util=json_util.default, compress_min_size: int=1024, compress_level: int=6):
+        """
+            :Properties:
+                - `compress_min_size` - bodies below this size (bytes) aren´t compressed
+                - `compress_level` - gzip/deflate compression level
+        """
         uninstall('json')
         self.json_dumps = json_dumps
         self.json_util = json_util
+        self.compress_min_size = compress_min_size
+        self.compress_level = compress_level
+
+    def default(self, obj, geometry: str="nodes", fields: tuple=None):
+        """Serializes compact objects (e.g. `WayResult`) with a `to_dict` method, everything else with `json_util`"""
+        if hasattr(obj, "to_dict"):
+            return obj.to_dict(geometry=geometry, fields=fields)
+        return self.json_util(obj)
 
     def apply(self, callback, context):
         def wrapper(*a, **ka):
             rv = callback(*a, **ka)
             if isinstance(rv, dict):
-                # Attempt to serialize, raises exception on failure
-                json_response = self.json_dumps(rv, default=self.json_util)
-                # Set content type only if serialization succesful
-                response.content_type = 'application/json'
+                geometry = "polyline" if request.query.get('geometry') == "polyline" else "nodes"
+                fields = request_fields()
+
+                def default(obj):
+                    return self.default(obj, geometry, fields)
 
-                # Wrap in callback function for JSONP
                 callback_function = request.query.get('callback')
-                if callback_function:
-                    response.content = 'application/javascript'
-                    json_response = ''.join([callback_function, '(', json_response, ')'])
-                return json_response
+                use_msgpack = msgpack is not None and not callback_function and self.__accepts(request.headers.get('Accept'), MSGPACK_TYPES)
+
+                if not use_msgpack and request.query.get('stream') in ("1", "true"):
+                    response.content_type = 'application/javascript' if callback_function else 'application/json'
+                    response.add_header('Vary', 'Accept, Accept-Encoding')
+                    # only the data version ETag (see `conditional_response`), the body isn´t known before it is sent
+                    etag = response.get_header('ETag')
+                    if etag is not None and _etag_matches(etag):
+                        return bottle.HTTPResponse(status=304, headers={'ETag': etag, 'Vary': 'Accept, Accept-Encoding'})
+                    encoding = self.__encoding()
+                    if encoding is not None:
+                        response.set_header('Content-Encoding', encoding)
+                    parts = self.__iter_json(rv, geometry, fields, default)
+                    if callback_function:
+                        parts = itertools.chain([callback_function, '('], parts, [')'])
+                    return self.__stream(parts, encoding)
+
+                if use_msgpack:
+                    body = msgpack.packb(rv, default=default, use_bin_type=True)
+                    response.content_type = 'application/msgpack'
+                else:
+                    # Attempt to serialize, raises exception on failure
+                    body = self.__dumps(rv, geometry, fields, default)
+                    # Set content type only if serialization succesful
+                    response.content_type = 'application/json'
+
+                    # Wrap in callback function for JSONP
+                    if callback_function:
+                        response.content_type = 'application/javascript'
+                        body = ''.join([callback_function, '(', body, ')'])
+
+                response.add_header('Vary', 'Accept, Accept-Encoding')
+                body = self.__compress(body)
+
+                etag = response.get_header('ETag')
+                if etag is None:
+                    etag = '"%s"' % hashlib.sha1(body if isinstance(body, bytes) else body.encode("utf-8")).hexdigest()
+                    response.set_header('ETag', etag)
+                if _etag_matches(etag):
+                    return bottle.HTTPResponse(status=304, headers={'ETag': etag, 'Vary': 'Accept, Accept-Encoding'})
+                return body
             return rv
         return wrapper
+
+    def __dumps(self, rv: dict, geometry: str, fields: tuple, default) -> str:
+        """Encodes the response dict"""
+        return "".join(self.__iter_json(rv, geometry, fields, default))
+
+    def __iter_json(self, rv: dict, geometry: str, fields: tuple, default):
+        """Encodes the response dict in parts, lists of `to_json` objects are written item by item from their (cached) fragments
+            :Returns:
+                a generator of `str`
+        """
+        lists = []
+        plain = {}
+        for key, value in rv.items():
+            if isinstance(value, list) and value and all(hasattr(item, "to_json") for item in value):
+                lists.append(key)
+            else:
+                plain[key] = value
+
+        try:
+            # fast path, plain types don´t need the default hook
+            body = self.json_dumps(plain)
+        except TypeError:
+            body = self.json_dumps(plain, default=default)
+
+        if not lists:
+            yield body
+            return
+
+        yield "{" + body[1:-1]
+        for position, key in enumerate(lists):
+            yield '%s%s: [' % (", " if plain or position else "", json.dumps(key))
+            for index, item in enumerate(rv[key]):
+                yield (", " if index else "") + item.to_json(geometry, fields)
+            yield "]"
+        yield "}"
+
+    def __stream(self, parts, encoding: str):
+        """Encodes (and compresses) the parts of a streamed response
+            :Returns:
+                a generator of `bytes`
+        """
+        if encoding is None:
+            for part in parts:
+                yield part.encode("utf-8")
+            return
+
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, 31 if encoding == "gzip" else 15)
+        first = True
+        for part in parts:
+            data = compressor.compress(part.encode("utf-8"))
+            if first:
+                # the envelope is sent at once, the rest when the compressor has enough data
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                first = False
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def __encoding(self) -> str:
+        """GET the negotiated content encoding (gzip, deflate or `None`)"""
+        header = request.headers.get('Accept-Encoding')
+        if self.__accepts(header, ("gzip",)):
+            return "gzip"
+        if self.__accepts(header, ("deflate",)):
+            return "deflate"
+        return None
+
+    def __compress(self, body):
+        """Compresses the body, if it is large enough and the client accepts gzip or deflate"""
+        if len(body) < self.compress_min_size:
+            return body
+
+        encoding = self.__encoding()
+        if encoding is None:
+            return body
+
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        if encoding == "gzip":
+            # without timestamp, so equal bodies get equal ETags
+            body = gzip.compress(body, self.compress_level, mtime=0)
+        else:
+            body = zlib.compress(body, self.compress_level)
+        response.set_header('Content-Encoding', encoding)
+        return body
+
+    def __accepts(self, header: str, values: tuple) -> bool:
+        """True if an Accept or Accept-Encoding header contains one of the values (with a q-value above 0)"""
+        if not header:
+            return False
+        for part in header.split(","):
+            params = part.strip().split(";")
+            if params[0].strip().lower() not in values:
+                continue
+            quality = [param.strip()[2:] for param in params[1:] if param.strip().startswith("q=")]
+            try:
+                if not quality or float(quality[0]) > 0:
+                    return True
+            except ValueError:
+                continue
+        return False
+
+
+def request_fields() -> tuple:
+    """GET the attributes requested with the `fields` param
+        :Returns:
+            a sorted `tuple` or `None` for all attributes
+    """
+    fields = request.query.getunicode('fields')
+    if not fields:
+        return None
+    return tuple(sorted(set(field.strip() for field in fields.split(",") if field.strip())))
+
+
+def conditional_response(version: str):
+    """Sets a strong ETag derived from the version of the data of a response and answers a matching `If-None-Match`
+    with 304, before any data is loaded or serialized
+        :Parameters:
+            - `version` - the data version (`None` - the plugin derives the ETag from the body)
+
+        :Raises:
+            a `bottle.HTTPResponse` with status 304
+    """
+    if version is None:
+        return
+
+    # the representation depends on the params and the negotiated headers
+    representation = "\n".join([version, request.query_string, request.headers.get('Accept', ''), request.headers.get('Accept-Encoding', '')])
+    etag = '"%s"' % hashlib.sha1(representation.encode("utf-8")).hexdigest()
+    response.set_header('ETag', etag)
+    if _etag_matches(etag):
+        raise bottle.HTTPResponse(status=304, headers={'ETag': etag, 'Vary': 'Accept, Accept-Encoding'})
+
+
+def _etag_matches(etag: str) -> bool:
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [value.strip() for value in header.split(",")]
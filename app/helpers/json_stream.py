@@ -0,0 +1,74 @@
+import codecs
+import json
+import re
+
+_whitespace = re.compile(r"[\s,]*")
+
+
+def iter_array_items(chunks, key: str="elements", rest: dict=None):
+    """Incrementally parses the items of an array member of a JSON object, without loading the whole document
+        `chunks` - an iterable of `bytes` (e.g. `response.iter_content()`)
+        `key` - the name of the array member
+        `rest` - a `dict`, filled with the members following the array once all items are read,
+          e.g. the `remark` overpass appends on runtime errors (optional)
+
+        :Returns:
+            a generator of the parsed items
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ""
+    position = 0
+    in_array = False
+    chunks = iter(chunks)
+    exhausted = False
+
+    while True:
+        if not in_array:
+            match = start.search(buffer)
+            if match is not None:
+                position = match.end()
+                in_array = True
+                continue
+            # keep enough characters to find a key split between two chunks
+            position = max(len(buffer) - len(key) - 64, 0)
+        else:
+            position = _whitespace.match(buffer, position).end()
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    if rest is not None:
+                        rest.update(_parse_rest(buffer[position + 1:], chunks, utf8))
+                    return
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    # incomplete item, needs the next chunk
+                    if exhausted:
+                        raise
+                else:
+                    yield item
+                    continue
+
+        if exhausted:
+            raise ValueError("unexpected end of JSON document, %s not found or not terminated" % key)
+        try:
+            chunk = utf8.decode(next(chunks))
+        except StopIteration:
+            chunk = utf8.decode(b"", final=True)
+            exhausted = True
+        # only the unparsed rest is kept
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def _parse_rest(buffer: str, chunks, utf8) -> dict:
+    """Parses the members following the array (`, "remark": "..."}`), the rest of a document is small"""
+    parts = [buffer]
+    for chunk in chunks:
+        parts.append(utf8.decode(chunk))
+    parts.append(utf8.decode(b"", final=True))
+    rest = "".join(parts).strip()
+    if rest.startswith(","):
+        rest = rest[1:]
+    return json.loads("{" + rest)
@@ -0,0 +1,17 @@
+import re
+
+# building types which never get a housenumber
+BUILDING_TYPES_FILTER = "garage|transformer_tower|sty|stable|shed|roof|hut|hangar|greenhouse|garages|farm_auxiliary|cowshed|cabin|bunker|bridge|barn|static_caravan|houseboat|terrace|train_station"
+
+_building_types_regex = re.compile(BUILDING_TYPES_FILTER)
+
+
+def is_building_without_housenumber(tags: dict) -> bool:
+    """Same filter as the overpass queries (building, no addr:housenumber, building type not filtered)
+        `tags` - the tags of a way
+    """
+    if "building" not in tags:
+        return False
+    if tags.get("addr:housenumber"):
+        return False
+    return _building_types_regex.search(tags["building"]) is None
@@ -0,0 +1,57 @@
+def encode_polyline(lats, lons, precision: int=6) -> str:
+    """Encodes coordinates in the (google) encoded polyline format, as deltas of the previous point
+        `lats` - sequence of latitudes
+        `lons` - sequence of longitudes
+        `precision` - decimal places kept (6 = polyline6, ~0.1m)
+
+        :Returns:
+            the polyline `str`
+    """
+    factor = 10 ** precision
+    output = []
+    previous_lat = 0
+    previous_lon = 0
+    for lat, lon in zip(lats, lons):
+        lat = int(round(lat * factor))
+        lon = int(round(lon * factor))
+        _encode_value(lat - previous_lat, output)
+        _encode_value(lon - previous_lon, output)
+        previous_lat = lat
+        previous_lon = lon
+    return "".join(output)
+
+
+def decode_polyline(polyline: str, precision: int=6) -> list:
+    """Decodes an encoded polyline
+        :Returns:
+            a `list` of (lat, lon) tuples
+    """
+    factor = float(10 ** precision)
+    values = []
+    value = 0
+    shift = 0
+    for char in polyline:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = 0
+            shift = 0
+
+    result = []
+    lat = 0
+    lon = 0
+    for i in range(0, len(values) - 1, 2):
+        lat += values[i]
+        lon += values[i + 1]
+        result.append((lat / factor, lon / factor))
+    return result
+
+
+def _encode_value(value: int, output: list):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        output.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    output.append(chr(value + 63))
@@ -0,0 +1,76 @@
+from math import cos, radians, sqrt
+
+METERS_PER_DEGREE = 6371000 * radians(1)
+# web mercator, 256 px tiles
+METERS_PER_PIXEL_AT_ZOOM_0 = 40075016.686 / 256
+
+
+def tolerance_for_zoom(zoom: int) -> float:
+    """Simplification tolerance in meters for a map zoom level (one pixel at the equator, so the levels are discrete)"""
+    return METERS_PER_PIXEL_AT_ZOOM_0 / 2 ** zoom
+
+
+def simplify_indices(lats, lons, tolerance: float) -> list:
+    """Douglas-Peucker simplification of a way, closed ways stay closed rings with at least three distinct vertices
+        `lats` - latitudes of the nodes
+        `lons` - longitudes of the nodes
+        `tolerance` - max deviation in meters
+
+        :Returns:
+            a `list` with the indices of the kept nodes
+    """
+    count = len(lats)
+    if count < 4 or tolerance <= 0:
+        return list(range(count))
+
+    # local equirectangular projection in meters, good enough for building outlines
+    scale_x = METERS_PER_DEGREE * cos(radians(lats[0]))
+    xs = [(lon - lons[0]) * scale_x for lon in lons]
+    ys = [(lat - lats[0]) * METERS_PER_DEGREE for lat in lats]
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    closed = lats[0] == lats[-1] and lons[0] == lons[-1]
+    if closed:
+        # the segment of a ring from its first to its last node is degenerate, so the ring is split at the farthest node
+        farthest = max(range(1, count - 1), key=lambda i: xs[i] ** 2 + ys[i] ** 2)
+        keep[farthest] = True
+        sections = [(0, farthest), (farthest, count - 1)]
+    else:
+        sections = [(0, count - 1)]
+
+    for first, last in sections:
+        _douglas_peucker(xs, ys, first, last, tolerance, keep)
+
+    if closed and sum(keep) < 4:
+        # a ring needs three distinct vertices, the one with the largest deviation is added
+        candidates = [(_segment_distance(xs, ys, i, first, last), i) for first, last in sections for i in range(first + 1, last)]
+        if candidates:
+            keep[max(candidates)[1]] = True
+
+    return [i for i in range(count) if keep[i]]
+
+
+def _douglas_peucker(xs: list, ys: list, first: int, last: int, tolerance: float, keep: list):
+    stack = [(first, last)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distance, index = max((_segment_distance(xs, ys, i, first, last), i) for i in range(first + 1, last))
+        if distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+
+def _segment_distance(xs: list, ys: list, i: int, first: int, last: int) -> float:
+    """Distance of node i to the segment first - last"""
+    dx = xs[last] - xs[first]
+    dy = ys[last] - ys[first]
+    length = dx * dx + dy * dy
+    if length == 0.0:
+        t = 0.0
+    else:
+        t = max(0.0, min(1.0, ((xs[i] - xs[first]) * dx + (ys[i] - ys[first]) * dy) / length))
+    return sqrt((xs[i] - xs[first] - t * dx) ** 2 + (ys[i] - ys[first] - t * dy) ** 2)
@@ -0,0 +1,36 @@
+"""Imports an OSM extract (.osm, .osm.bz2, .osm.gz, .osm.pbf) into the local building store
+
+    usage: python import_extract.py <extract> [--node-index <file>] [--batch-size <n>]
+"""
+import argparse
+import logging
+
+import sqlalchemy
+import sqlalchemy.orm
+
+import settings
+from classes.BuildingStore import BuildingStore
+from classes.Database import Base as database
+from classes.OsmImporter import OsmImporter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import an OSM extract into the building store")
+    parser.add_argument("extract", help="path of the .osm / .osm.pbf extract")
+    parser.add_argument("--node-index", default=None, help="file for the on-disk node index (default: temporary file)")
+    parser.add_argument("--batch-size", type=int, default=500, help="ways per bulk insert")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    engine = sqlalchemy.create_engine(settings.DB_CONNECTION)
+    database.metadata.create_all(engine)
+    store = BuildingStore(sqlalchemy.orm.sessionmaker(bind=engine), zoom=settings.BUILDING_STORE["zoom"], max_age=settings.BUILDING_STORE["max_age"])
+
+    importer = OsmImporter(store, tile_zoom=settings.OVERPASS_TILE_CACHE["zoom"], batch_size=args.batch_size, node_index_path=args.node_index)
+    result = importer.import_file(args.extract)
+    print("%(ways)s ways imported, %(skipped)s skipped, %(tiles)s tiles marked as loaded, %(ways_per_second).0f ways/sec" % result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Applies osmChange replication diffs to the local building store
+
+    usage: python replicate.py [--once]
+"""
+import argparse
+import logging
+import time
+
+import sqlalchemy
+import sqlalchemy.orm
+
+import settings
+from classes.BuildingStore import BuildingStore
+from classes.Database import Base as database
+from classes.ReplicationWorker import ReplicationWorker
+from classes.UpstreamClient import upstream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply replication diffs to the building store")
+    parser.add_argument("--once", action="store_true", help="apply the available diffs and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    upstream.configure(settings.UPSTREAMS, pool_size=settings.UPSTREAM_POOL_SIZE)
+
+    engine = sqlalchemy.create_engine(settings.DB_CONNECTION)
+    database.metadata.create_all(engine)
+    session_factory = sqlalchemy.orm.sessionmaker(bind=engine)
+    store = BuildingStore(session_factory, zoom=settings.BUILDING_STORE["zoom"], max_age=settings.BUILDING_STORE["max_age"])
+
+    worker = ReplicationWorker(store, session_factory, directory=settings.REPLICATION["directory"],
+                               interval=settings.REPLICATION["interval"], start_sequence=settings.REPLICATION["start_sequence"])
+    if args.once:
+        print("%s diffs applied" % worker.run_once())
+    else:
+        worker.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    main()
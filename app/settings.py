@@ -154,6 +154,178 @@ EDIT_FIELDS = [
 
 
 
+# gzip/deflate of the api responses
+RESPONSE_COMPRESSION = {
+    # bodies below this size (bytes) aren´t compressed
+    "min_size": 1024,
+    "level": 6
+}
+
+
+# edit form: reverse geocoding overlapped with the way lookup
+EDIT_FORM = {
+    # threads for the reverse geocoding, which runs concurrently with the way lookup
+    "workers": 8,
+    # seconds for the reverse geocoding, a form without the prefilled address is returned if it takes longer
+    "deadline": 4
+}
+
+
+# in-process cache for rendered edit forms
+FORM_CACHE = {
+    "enabled": True,
+    # rendered edit forms per way id and version, the ttl bounds the age of the prefilled address
+    "max_forms": 4096,
+    "ttl": 3600
+}
+
+
+# reverse geocoding for the edit form prefill and /reverse-geocode
+REVERSE_GEOCODER = {
+    # "nominatim" or "local" (streets, places and postcodes of an extract, nominatim as fallback outside of it)
+    "engine": "nominatim",
+    # .osm, .osm.bz2, .osm.gz or .osm.pbf extract for the local engine
+    "extract": None,
+    # max distance to the nearest street in meters
+    "max_road_distance": 250,
+    # local engine: also index the addresses with addr:postcode as postcode fallback outside of postal_code boundaries (memory heavy)
+    "address_points": False,
+    # max points per POST /reverse-geocode
+    "max_batch": 100,
+    # seconds per POST /reverse-geocode, later only cached addresses are returned
+    "batch_deadline": 5
+}
+
+
+# cache for nominatim reverse geocoding results per spatial cell
+REVERSE_GEOCODE_CACHE = {
+    # edge length of the cells in degrees (~55m), locations in one cell share the address
+    "cell_size": 0.0005,
+    "max_cells": 50000,
+    "ttl": 24 * 3600,
+    # persist the cells in the database, to survive restarts
+    "persist": True,
+    "persist_ttl": 30 * 24 * 3600
+}
+
+
+# upstream apis (timeouts in seconds, retries only for idempotent calls, circuit opens after failure_threshold failed calls)
+UPSTREAMS = {
+    "overpass": {
+        "url": "http://www.overpass-api.de/api/interpreter",
+        "timeout": 30,
+        "retries": 1,
+        "backoff": 1,
+        "failure_threshold": 5,
+        "reset_timeout": 60
+    },
+    "nominatim": {
+        "url": "http://nominatim.openstreetmap.org",
+        "timeout": 5,
+        "retries": 2,
+        "backoff": 0.5,
+        "failure_threshold": 5,
+        "reset_timeout": 30,
+        # usage policy: max 1 request per second, calls which would wait longer than max_wait are rejected
+        "rate": 1,
+        "burst": 1,
+        "max_queue": 20,
+        "max_wait": 5
+    },
+    "osm_api": {
+        "url": "https://api.openstreetmap.org",
+        "timeout": 15,
+        "retries": 2,
+        "backoff": 0.5,
+        "failure_threshold": 5,
+        "reset_timeout": 30
+    },
+    # replication diffs, a planet mirror or a local stand-in server
+    "replication": {
+        "url": "http://planet.openstreetmap.org/replication/minute",
+        "timeout": 30,
+        "retries": 2,
+        "backoff": 1,
+        "failure_threshold": 5,
+        "reset_timeout": 60
+    }
+}
+
+UPSTREAM_POOL_SIZE = 20
+
+
+# in-process cache for overpass results per quadtile
+OVERPASS_TILE_CACHE = {
+    "enabled": True,
+    "zoom": 16,
+    "ttl": 900,
+    "max_tiles": 4096,
+    # larger searchareas are queried directly, without tile cache and building store
+    "max_request_tiles": 256
+}
+
+
+# background prefetch of the tiles around served requests
+PREFETCH = {
+    # needs the tile cache or the building store
+    "enabled": True,
+    # tile rings around the tiles of a served request
+    "rings": 1,
+    # max concurrent prefetch requests
+    "workers": 2,
+    "max_pending": 64,
+    # the ring is loaded in strips, max tiles per overpass query
+    "tiles_per_request": 16,
+    # own overpass budget, without token a strip isn´t prefetched (burst: strips of one ring at once)
+    "requests_per_minute": 6,
+    "burst": 4
+}
+
+
+# scheduled warm-up of the caches for configured regions
+WARMUP = {
+    # needs the tile cache or the building store, the interval should be shorter than their ttl/max_age
+    "enabled": False,
+    # seconds between two warm-ups of a region
+    "interval": 6 * 3600,
+    # upstream budget of the warm-up
+    "requests_per_minute": 6,
+    "tiles_per_request": 4,
+    # e.g. {"name": "berlin-mitte", "north": 52.5400, "south": 52.5000, "east": 13.4300, "west": 13.3600}
+    "regions": []
+}
+
+
+# in-process cache for single ways, by osm id
+WAY_CACHE = {
+    "enabled": True,
+    # short lived, shared by GET /buildings/<id>, the edit form and the edit
+    "ttl": 300,
+    "max_ways": 4096
+}
+
+
+# local persistent store of buildings without housenumber, overpass is only queried for tiles not loaded yet
+BUILDING_STORE = {
+    "enabled": True,
+    # quadtile zoom level of the spatial index
+    "zoom": 16,
+    # seconds until a loaded tile is refetched (None keeps tiles forever, e.g. if kept up to date by replication)
+    "max_age": 7 * 24 * 3600
+}
+
+
+# applies osmChange diffs to the building store
+REPLICATION = {
+    "enabled": False,
+    # local replication directory (AAA/BBB/CCC.osc.gz + state.txt), None reads from the "replication" upstream
+    "directory": None,
+    "interval": 60,
+    # first sequence to apply after the import, None starts at the current remote sequence
+    "start_sequence": None
+}
+
+
 DB_CONNECTION = "sqlite:///test.db"
 
 def get_osm_auth():
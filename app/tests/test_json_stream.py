@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from helpers.json_stream import iter_array_items
+
+
+def chunked(document: str, size: int):
+    data = document.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class IterArrayItemsTest(unittest.TestCase):
+
+    document = json.dumps({
+        "version": 0.6,
+        "osm3s": {"copyright": "The data included in this document is from www.openstreetmap.org."},
+        "elements": [
+            {"type": "node", "id": 1, "lat": 52.5, "lon": 13.4},
+            {"type": "way", "id": 2, "nodes": [1, 1], "tags": {"name": "Straße \"[Ecke]\", {quoted}\\"}},
+            {"type": "node", "id": 3, "lat": -0.5, "lon": 1e-07}
+        ]
+    })
+
+    def test_whole_document(self):
+        self.assertEqual(list(iter_array_items([self.document.encode("utf-8")])), json.loads(self.document)["elements"])
+
+    def test_chunk_boundaries(self):
+        expected = json.loads(self.document)["elements"]
+        # every split position, also inside the key, escapes and multibyte characters
+        for size in range(1, 40):
+            self.assertEqual(list(iter_array_items(chunked(self.document, size))), expected, "chunk size %s" % size)
+
+    def test_escaped_strings(self):
+        items = list(iter_array_items(chunked(self.document, 7)))
+        self.assertEqual(items[1]["tags"]["name"], "Straße \"[Ecke]\", {quoted}\\")
+
+    def test_empty_array(self):
+        rest = {}
+        self.assertEqual(list(iter_array_items(chunked('{"elements": [ ], "remark": "x"}', 3), rest=rest)), [])
+        self.assertEqual(rest, {"remark": "x"})
+
+    def test_trailing_remark(self):
+        document = self.document[:-1] + ', "remark": "runtime error: Query timed out in \\"query\\" at line 3 after 26 seconds."}'
+        for size in (1, 5, 64, 4096):
+            rest = {}
+            items = list(iter_array_items(chunked(document, size), rest=rest))
+            self.assertEqual(len(items), 3)
+            self.assertEqual(rest["remark"], 'runtime error: Query timed out in "query" at line 3 after 26 seconds.')
+
+    def test_without_trailing_members(self):
+        rest = {}
+        list(iter_array_items(chunked(self.document, 10), rest=rest))
+        self.assertEqual(rest, {})
+
+    def test_truncated_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_array_items(chunked(self.document[:len(self.document) // 2], 16)))
+
+    def test_truncated_rest(self):
+        with self.assertRaises(ValueError):
+            list(iter_array_items(chunked(self.document[:-1] + ', "remark": "runtime', 16), rest={}))
+
+    def test_missing_key(self):
+        with self.assertRaises(ValueError):
+            list(iter_array_items(chunked('{"remark": "runtime error: out of memory"}', 8)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from helpers.polyline import encode_polyline, decode_polyline
+
+
+class PolylineTest(unittest.TestCase):
+
+    # the example of the encoded polyline algorithm format documentation
+    lats = [38.5, 40.7, 43.252]
+    lons = [-120.2, -120.95, -126.453]
+    encoded = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+    def test_encode_reference(self):
+        self.assertEqual(encode_polyline(self.lats, self.lons, precision=5), self.encoded)
+
+    def test_decode_reference(self):
+        self.assertEqual(decode_polyline(self.encoded, precision=5), list(zip(self.lats, self.lons)))
+
+    def test_round_trip_polyline6(self):
+        lats = [52.5163, 52.516312, -33.856784, 0.0, 0.000001]
+        lons = [13.377704, 13.3777, 151.215297, 0.0, -179.999999]
+        decoded = decode_polyline(encode_polyline(lats, lons))
+        self.assertEqual(len(decoded), len(lats))
+        for (lat, lon), expected_lat, expected_lon in zip(decoded, lats, lons):
+            self.assertAlmostEqual(lat, expected_lat, places=6)
+            self.assertAlmostEqual(lon, expected_lon, places=6)
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline([], []), "")
+        self.assertEqual(decode_polyline(""), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.RateLimiter import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_burst_then_rejected(self):
+        limiter = RateLimiter(rate=0.1, burst=3)
+        self.assertTrue(all(limiter.try_acquire() for _ in range(3)))
+        self.assertFalse(limiter.try_acquire())
+        self.assertEqual(limiter.stats()["acquired"], 3)
+        self.assertEqual(limiter.stats()["rejected"], 1)
+
+    def test_refill(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        time.sleep(0.05)
+        self.assertTrue(limiter.try_acquire())
+
+    def test_acquire_waits_for_the_next_token(self):
+        limiter = RateLimiter(rate=20, burst=1)
+        limiter.acquire()
+        started_at = time.monotonic()
+        self.assertTrue(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.04)
+        self.assertEqual(limiter.stats()["waiting"], 0)
+
+    def test_acquire_rejects_at_once_beyond_the_timeout(self):
+        limiter = RateLimiter(rate=0.1, burst=1)
+        limiter.acquire()
+        self.assertGreater(limiter.expected_wait(), 9)
+        started_at = time.monotonic()
+        self.assertFalse(limiter.acquire(timeout=1))
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertEqual(limiter.rejected, 1)
+
+    def test_waiting_callers_are_reserved_in_order(self):
+        limiter = RateLimiter(rate=10, burst=1)
+        limiter.acquire()
+        # the first waiter reserved the next token, the second one waits a token longer
+        first = threading.Thread(target=limiter.acquire)
+        first.start()
+        while limiter.stats()["waiting"] < 1:
+            time.sleep(0.001)
+        self.assertGreater(limiter.expected_wait(), 0.1)
+        first.join(5)
+
+    def test_max_queue(self):
+        limiter = RateLimiter(rate=10, burst=1, max_queue=1)
+        limiter.acquire()
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        while limiter.stats()["waiting"] < 1:
+            time.sleep(0.001)
+        self.assertFalse(limiter.acquire())
+        waiter.join(5)
+        self.assertEqual(limiter.rejected, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
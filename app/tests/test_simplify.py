@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.Way import Way, WayBatch
+from helpers.simplify import simplify_indices, tolerance_for_zoom, METERS_PER_DEGREE
+
+
+def square_with_bump(bump: float):
+    """A closed 10m square with a node `bump` meters outside of the middle of its south edge"""
+    side = 10.0 / METERS_PER_DEGREE
+    offset = bump / METERS_PER_DEGREE
+    lats = [0.0, -offset, 0.0, side, side, 0.0]
+    lons = [0.0, side / 2, side, side, 0.0, 0.0]
+    return lats, lons
+
+
+class SimplifyIndicesTest(unittest.TestCase):
+
+    def test_small_deviation_is_removed(self):
+        lats, lons = square_with_bump(0.5)
+        self.assertEqual(simplify_indices(lats, lons, 1.0), [0, 2, 3, 4, 5])
+
+    def test_large_deviation_is_kept(self):
+        lats, lons = square_with_bump(2.0)
+        self.assertEqual(simplify_indices(lats, lons, 1.0), [0, 1, 2, 3, 4, 5])
+
+    def test_ring_keeps_three_distinct_vertices(self):
+        lats, lons = square_with_bump(0.5)
+        keep = simplify_indices(lats, lons, 100.0)
+        self.assertEqual(len(keep), 4)
+        self.assertEqual((keep[0], keep[-1]), (0, 5))
+
+    def test_open_way_keeps_its_ends(self):
+        lats = [0.0, 0.1 / METERS_PER_DEGREE, 0.0, 0.0]
+        lons = [0.0, 5.0 / METERS_PER_DEGREE, 10.0 / METERS_PER_DEGREE, 20.0 / METERS_PER_DEGREE]
+        self.assertEqual(simplify_indices(lats, lons, 1.0), [0, 3])
+
+    def test_short_ways_and_zero_tolerance_are_unchanged(self):
+        self.assertEqual(simplify_indices([0.0, 1.0, 0.0], [0.0, 1.0, 1.0], 1000.0), [0, 1, 2])
+        lats, lons = square_with_bump(0.5)
+        self.assertEqual(simplify_indices(lats, lons, 0), list(range(6)))
+
+    def test_tolerance_halves_per_zoom(self):
+        self.assertAlmostEqual(tolerance_for_zoom(0), 156543.03, places=2)
+        self.assertAlmostEqual(tolerance_for_zoom(17) * 2, tolerance_for_zoom(16))
+
+
+class WaySimplifyTest(unittest.TestCase):
+
+    def way(self, bump: float) -> Way:
+        lats, lons = square_with_bump(bump)
+        return WayBatch().add(1, {"building": "yes"}, [1, 2, 3, 4, 5, 1], lats, lons, version=3)
+
+    def test_simplified_way(self):
+        way = self.way(0.5)
+        simplified = way.simplify(1.0)
+        self.assertEqual(list(simplified.node_ids), [1, 3, 4, 5, 1])
+        self.assertEqual((simplified.id, simplified.version, simplified.tags), (1, 3, {"building": "yes"}))
+        self.assertEqual(simplified.centroid, way.centroid)
+        self.assertIs(way.simplify(1.0), simplified)
+
+    def test_unchanged_way_is_returned(self):
+        way = self.way(2.0)
+        self.assertIs(way.simplify(1.0), way)
+
+    def test_cached_variants_are_capped(self):
+        way = self.way(0.5)
+        for i in range(Way.MAX_VARIANTS * 2):
+            way.simplify(1.0 + i)
+        self.assertEqual(len(way.simplified), Way.MAX_VARIANTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.SingleFlight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, flights: SingleFlight, key, func, callers: int) -> tuple:
+        """Calls `func` through `flights` from `callers` threads, returns the results and errors"""
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(flights.do(key, func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_concurrent_calls_are_coalesced(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return {"id": 1}
+
+        def waiting():
+            while flights.stats()["calls"] < 5:
+                time.sleep(0.001)
+            release.set()
+
+        threading.Thread(target=waiting).start()
+        results, errors = self.run_concurrently(flights, "way:1", load, 5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"id": 1}] * 5)
+        self.assertEqual(errors, [])
+        self.assertEqual(flights.stats(), {"calls": 5, "deduplicated": 4, "in_flight": 0})
+
+    def test_error_is_raised_to_all_callers(self):
+        flights = SingleFlight()
+        release = threading.Event()
+
+        def load():
+            release.wait(5)
+            raise ValueError("upstream failed")
+
+        def waiting():
+            while flights.stats()["calls"] < 3:
+                time.sleep(0.001)
+            release.set()
+
+        threading.Thread(target=waiting).start()
+        results, errors = self.run_concurrently(flights, "way:1", load, 3)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+    def test_sequential_calls_run_again(self):
+        flights = SingleFlight()
+        calls = []
+        for _ in range(3):
+            flights.do("way:1", calls.append, 1)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(flights.deduplicated, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
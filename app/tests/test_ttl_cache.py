@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from classes.TTLCache import TTLCache
+
+
+class TTLCacheTest(unittest.TestCase):
+
+    def test_get_counts_hits_and_misses(self):
+        cache = TTLCache(max_size=10)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b", "default"), "default")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hit_ratio"], 0.5)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = TTLCache(max_size=10)
+        cache.set("a", 1, ttl=-1)
+        self.assertNotIn("a", cache)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_peek_is_not_counted_and_keeps_the_lru_order(self):
+        cache = TTLCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.peek("a"), 1)
+        self.assertIsNone(cache.peek("c"))
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+        cache.set("c", 3)
+        self.assertNotIn("a", cache)
+
+    def test_replace_keeps_the_expiry(self):
+        cache = TTLCache(max_size=10)
+        self.assertFalse(cache.replace("a", 1))
+        cache.set("a", 1, ttl=-1)
+        self.assertFalse(cache.replace("a", 2))
+        cache.set("b", 1)
+        self.assertTrue(cache.replace("b", 2))
+        self.assertEqual(cache.get("b"), 2)
+
+    def test_pop_and_clear(self):
+        cache = TTLCache(max_size=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertIsNone(cache.pop("a"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()